@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""Генератор синтетических M3U по образцу IPTV_MEGA_PLAYLIST.m3u и ZARUB.m3u"""
+import argparse
+import random
+
+# Тот же inline-заглушка логотипа, что тысячи раз повторяется в IPTV_MEGA_PLAYLIST.m3u
+SVG_LOGO = ('data:image/svg+xml,<svg xmlns="http://www.w3.org/2000/svg" width="28" height="28">'
+            '<rect width="28" height="28" rx="3" fill="%230b1018"/><text x="14" y="19" font-size="10" '
+            'text-anchor="middle" fill="%232a3848" font-family="monospace">TV</text></svg>')
+GROUPS = [
+    'GitHub - iptv-org', 'Aggregator - Rafail1982', 'Aggregator - M3U.SU / Россия 🇷🇺',
+    'Aggregator - Axenov / Региональные', 'Aggregator - Rafail1982 / Музыкальные',
+    'Италия 🇮🇹', 'Турция 🇹🇷', 'США 🇺🇸', 'Франция 🇫🇷', 'Германия 🇩🇪', 'Украина 🇺🇦',
+    'News', 'Sport', 'Movies', 'Kids', '🔺 INFO 🔺',
+]
+WORDS = ['Milliy', 'Navo', 'Futbol', 'Dunyo', 'Alvin', 'Azstar', 'Первый', 'Россия', 'Матч', 'Sport',
+         'News', 'Music', 'Kino', 'Channel', 'TV', 'Rai', 'France', 'Deutsche', 'BBC', 'Euro', 'Kids']
+SUFFIXES = ['', '', '', ' HD', ' (360p)', ' (720p) [Not 24/7]', ' UZ', ' [Geo-blocked]', ' TV']
+HOSTS = ['cdn10-{}.yayin.com.tr', 's05.watcher.uz', 'live.{}.ru', 'stream.{}.de', 'edge{}.cloudfront.net',
+         '194.26.229.{}', 'hls.{}.com', 'tv.{}.it', 'media.{}.fr', 'iptv.{}.ua']
+COUNTRIES = ['', '', '', 'RU', 'US', 'UK', 'DE', 'FR', 'IT', 'ES', 'UA', 'PL']
+
+
+def _url(rnd, i):
+    host = rnd.choice(HOSTS).format(rnd.randint(1, 300))
+    scheme = rnd.choice(['http', 'https'])
+    return f'{scheme}://{host}/live/{i}/playlist.m3u8'
+
+
+def _duplicate(rnd, url):
+    """Тот же поток в другом виде: другая схема, слэш на конце или токен"""
+    kind = rnd.randrange(3)
+    if kind == 0:
+        return url.replace('https://', 'http://', 1) if url.startswith('https') else url.replace('http', 'https', 1)
+    if kind == 1:
+        return url + '/'
+    return f'{url}?token={rnd.getrandbits(64):x}'
+
+
+def generate(path, n, seed=42):
+    """Пишет плейлист из n записей (включая битые) потоково, без хранения в памяти"""
+    rnd = random.Random(seed)
+    recent = []
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('#EXTM3U\n\n')
+        for i in range(n):
+            roll = rnd.random()
+            name = ' '.join(rnd.sample(WORDS, rnd.randint(1, 3))) + rnd.choice(SUFFIXES)
+            attrs = []
+            if rnd.random() < 0.3:
+                attrs.append(f'tvg-id="{name.split()[0]}.{rnd.choice(["ru", "us", "uz", "it"])}"')
+            country = rnd.choice(COUNTRIES)
+            if country:
+                attrs.append(f'tvg-country="{country}"')
+            logo_roll = rnd.random()
+            if logo_roll < 0.45:
+                attrs.append(f'tvg-logo="{SVG_LOGO}"')
+            elif logo_roll < 0.75:
+                attrs.append(f'tvg-logo="http://tv.team/images/chIcons/{rnd.randint(1, 3000)}.png"')
+            attrs.append(f'group-title="{rnd.choice(GROUPS)}"')
+            if rnd.random() < 0.05:
+                attrs.append('catchup="default" catchup-days="7" user-agent="Mozilla/5.0 (X11; Linux)"')
+            rnd.shuffle(attrs)
+
+            if roll < 0.01:
+                # Битая запись: нет запятой перед названием
+                f.write(f'#EXTINF:-1 {" ".join(attrs)}\n')
+            else:
+                f.write(f'#EXTINF:-1 {" ".join(attrs)},{name}\n')
+            if roll < 0.02:
+                # Битая запись: нет URL, сразу следующий #EXTINF
+                continue
+            if rnd.random() < 0.05:
+                f.write('#EXTVLCOPT:http-user-agent=Mozilla/5.0\n')
+            if rnd.random() < 0.01:
+                f.write('#KODIPROP:inputstream.adaptive.manifest_type=hls\n')
+            if rnd.random() < 0.01:
+                f.write('\n# comment\n')
+
+            if roll < 0.03:
+                f.write(f'rtmp://legacy.example.net/live/{i}\n')
+            elif recent and rnd.random() < 0.15:
+                f.write(_duplicate(rnd, rnd.choice(recent)) + '\n')
+            else:
+                url = _url(rnd, i)
+                f.write(url + '\n')
+                recent.append(url)
+                if len(recent) > 1000:
+                    recent.pop(rnd.randrange(len(recent)))
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Синтетический M3U для бенчмарков')
+    parser.add_argument('path')
+    parser.add_argument('-n', '--entries', type=int, default=100_000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    generate(args.path, args.entries, args.seed)
+    print(f"✅ {args.path}: {args.entries} записей")
+
+
+if __name__ == '__main__':
+    main()
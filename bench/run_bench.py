@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""Замеры стадий: parse, classify, dedup, write, site (и fetch через заглушку) с базовой линией в JSON"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import iptv_hunter  # noqa: E402
+from iptv_classify import classify  # noqa: E402
+from iptv_dedup import dedup_ids, materialize, rank_alternates  # noqa: E402
+from iptv_m3u import iter_m3u, parse_extinf  # noqa: E402
+from iptv_parallel import iter_m3u_file  # noqa: E402
+from iptv_store import ChannelStore  # noqa: E402
+
+from gen_corpus import generate  # noqa: E402
+from stub_server import StubServer  # noqa: E402
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+CORPUS_DIR = os.path.join(ROOT, '.cache', 'bench')
+# Во сколько раз стадия может замедлиться относительно базовой линии, прежде чем считаться регрессией
+TOLERANCE = 1.25
+# Стадии быстрее этого порога слишком шумные, чтобы судить о регрессии
+MIN_SECONDS = 0.01
+
+
+def best_of(repeat, fn):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def corpus(size):
+    os.makedirs(CORPUS_DIR, exist_ok=True)
+    path = os.path.join(CORPUS_DIR, f'synthetic_{size}.m3u')
+    if not os.path.exists(path):
+        generate(path, size)
+    return path
+
+
+def bench_size(size, repeat):
+    path = corpus(size)
+    timings = {}
+
+    def parse():
+        with open(path, encoding='utf-8') as f:
+            return list(iter_m3u(f))
+    timings['parse'], records = best_of(repeat, parse)
+
+    def extinf_rows():
+        rows = []
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('#EXTINF:'):
+                    attrs, name = parse_extinf(line.rstrip('\n'))
+                    rows.append((line, attrs, name))
+        return rows
+    rows = extinf_rows()
+    urls = [c['url'] for c in records]
+
+    def classify_all():
+        return [classify(line, attrs, name, urls[i % len(urls)]) for i, (line, attrs, name) in enumerate(rows)]
+    timings['classify'], _ = best_of(repeat, classify_all)
+
+    with open(path, encoding='utf-8') as f:
+        channels = list(iter_m3u(f, classify=classify))
+
+    # Разбор с классификацией через пул процессов (на одном ядре или без пула - последовательно)
+    timings['parse_mp'], _ = best_of(repeat, lambda: list(iter_m3u_file(path, classify=classify, min_bytes=0)))
+
+    def dedup():
+        store = ChannelStore()
+        store.extend(channels, source='bench')
+        entries, _ = dedup_ids(store)
+        return rank_alternates(materialize(store, entries))
+    timings['dedup'], unique = best_of(repeat, dedup)
+
+    by_country = iptv_hunter.group_by_country(unique)
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            timings['write'], _ = best_of(repeat, lambda: iptv_hunter.write_playlists(by_country))
+            timings['site'], _ = best_of(repeat, lambda: iptv_hunter.create_website(unique, by_country))
+        finally:
+            os.chdir(cwd)
+
+    return {'entries': size, 'channels': len(channels), 'unique': len(unique),
+            'seconds': {k: round(v, 4) for k, v in timings.items()}}
+
+
+FETCH_SNIPPET = """
+import contextlib, io, json, sys, time
+sys.path.insert(0, sys.argv[1])
+import iptv_hunter
+urls = json.loads(sys.argv[2])
+out = {}
+for stage in ('fetch_cold', 'fetch_warm'):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        iptv_hunter.fetch_many(urls, iptv_hunter.load_source)
+    out[stage] = round(time.perf_counter() - start, 4)
+print(json.dumps(out))
+"""
+
+
+def bench_fetch(sources, latency):
+    """Загрузка sources плейлистов с заглушки: с пустым кэшем и повторно (ответы 304)"""
+    path = corpus(1000)
+    with tempfile.TemporaryDirectory() as tmp, \
+            StubServer(root=os.path.dirname(path), latency=latency) as base:
+        urls = [f'{base}/files/{os.path.basename(path)}?n={i}' for i in range(sources)]
+        # Отдельный процесс: свой каталог HTTP-кэша, чтобы не трогать .cache/http.
+        # Все источники на одном хосте заглушки, поэтому паузу вежливости отключаем -
+        # иначе замер покажет только ее.
+        env = {**os.environ, 'IPTV_CACHE_DIR': os.path.join(tmp, 'http'),
+               'IPTV_HOST_DELAY': '0', 'IPTV_PER_HOST_LIMIT': str(sources)}
+        out = subprocess.run([sys.executable, '-c', FETCH_SNIPPET, ROOT, json.dumps(urls)],
+                             env=env, capture_output=True, text=True, check=True)
+    return {'sources': sources, 'latency': latency, 'seconds': json.loads(out.stdout.splitlines()[-1])}
+
+
+def compare(results, baseline):
+    """Печатает отношение к базовой линии; возвращает список регрессий"""
+    regressions = []
+    for key, res in results.items():
+        base = baseline.get('results', {}).get(key)
+        for stage, seconds in res['seconds'].items():
+            ref = (base or {}).get('seconds', {}).get(stage)
+            ratio = seconds / ref if ref else None
+            mark = ''
+            if ratio and ratio > TOLERANCE and seconds >= MIN_SECONDS:
+                mark = ' ⚠️  регрессия'
+                regressions.append(f'{key}/{stage}')
+            shown = f'x{ratio:.2f}' if ratio else 'нет базы'
+            print(f"   {key:>10} {stage:<9} {seconds:9.4f} с  ({shown}){mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарки IPTV Hunter')
+    parser.add_argument('--sizes', default='1000,100000',
+                        help='размеры корпусов через запятую (например 1000,100000,1000000)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--fetch', action='store_true', help='замерить загрузку источников через заглушку')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='записать результаты как новую базовую линию')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+
+    results = {}
+    for size in (int(s) for s in args.sizes.split(',') if s):
+        print(f"⏱️  Корпус {size} записей...")
+        results[f'm3u_{size}'] = bench_size(size, args.repeat)
+    if args.fetch:
+        print("⏱️  Загрузка 24 источников с задержкой 0.5 с...")
+        results['fetch_24'] = bench_fetch(24, 0.5)
+
+    try:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    except (OSError, ValueError):
+        baseline = {}
+    regressions = compare(results, baseline)
+
+    if args.update_baseline:
+        report = {'time': datetime.now().isoformat(), 'python': platform.python_version(),
+                  'machine': platform.machine(), 'results': {**baseline.get('results', {}), **results}}
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"💾 Базовая линия обновлена: {args.baseline}")
+
+    if regressions and args.fail_on_regression:
+        print(f"❌ Регрессии: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
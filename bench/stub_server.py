@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""Локальный HTTP-сервер вместо реальных источников и потоков: задержки, 304, ошибки, медленные тела"""
+import argparse
+import hashlib
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+
+class StubConfig:
+    def __init__(self, root='.', latency=0.0, fail_rate=0.0, throttle=0, seed=1):
+        self.root = root
+        self.latency = latency          # задержка перед ответом, секунд
+        self.fail_rate = fail_rate      # доля ответов 503
+        self.throttle = throttle        # байт/с для тела (0 - без ограничения)
+        self.rnd = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'not_modified': 0, 'failed': 0}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """GET /files/<имя> - файлы из root с ETag; GET /hls/<id>/... - синтетический HLS.
+
+    Параметры запроса перекрывают настройки: ?delay=0.5&fail=1&slow=20000
+    """
+    config = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        cfg = self.config
+        parts = urlsplit(self.path)
+        q = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+        with cfg.lock:
+            cfg.stats['requests'] += 1
+            fail = q.get('fail') == '1' or cfg.rnd.random() < cfg.fail_rate
+        time.sleep(float(q.get('delay', cfg.latency)))
+        if fail:
+            with cfg.lock:
+                cfg.stats['failed'] += 1
+            return self._send(503, b'unavailable')
+
+        if parts.path.startswith('/files/'):
+            return self._file(parts.path[len('/files/'):], int(q.get('slow', cfg.throttle)))
+        if parts.path.startswith('/hls/'):
+            return self._hls(parts.path[len('/hls/'):])
+        return self._send(404, b'not found')
+
+    def _file(self, name, throttle):
+        path = os.path.join(self.config.root, os.path.basename(name))
+        if not os.path.isfile(path):
+            return self._send(404, b'not found')
+        stat = os.stat(path)
+        etag = '"' + hashlib.md5(f'{stat.st_size}-{stat.st_mtime_ns}'.encode()).hexdigest() + '"'
+        if self.headers.get('If-None-Match') == etag:
+            with self.config.lock:
+                self.config.stats['not_modified'] += 1
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'audio/x-mpegurl')
+        self.send_header('Content-Length', str(stat.st_size))
+        self.end_headers()
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(throttle or 64 * 1024)
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                if throttle:
+                    time.sleep(1)
+
+    def _hls(self, rest):
+        # <id>/master.m3u8 -> <id>/720.m3u8 -> <id>/seg0.ts; id, начинающийся с dead, отдает 404
+        stream, _, name = rest.partition('/')
+        if stream.startswith('dead'):
+            return self._send(404, b'gone')
+        if name == 'master.m3u8':
+            body = ('#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION=640x360\n360.m3u8\n'
+                    '#EXT-X-STREAM-INF:BANDWIDTH=2800000,RESOLUTION=1280x720\n720.m3u8\n')
+        elif name.endswith('.m3u8'):
+            body = '#EXTM3U\n#EXT-X-TARGETDURATION:6\n#EXTINF:6.0,\nseg0.ts\n#EXTINF:6.0,\nseg1.ts\n'
+        elif name.endswith('.ts'):
+            return self._send(206 if self.headers.get('Range') else 200, b'\x47' * 2048, 'video/mp2t')
+        else:
+            return self._send(404, b'not found')
+        return self._send(200, body.encode(), 'application/vnd.apple.mpegurl')
+
+    def _send(self, status, body, content_type='text/plain'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StubServer:
+    """Сервер в фоновом потоке: with StubServer(...) as base_url: ..."""
+
+    def __init__(self, host='127.0.0.1', port=0, **config):
+        self.config = StubConfig(**config)
+        handler = type('Handler', (StubHandler,), {'config': self.config})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def __enter__(self):
+        self.thread.start()
+        return self.base_url
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Заглушка источников и потоков для бенчмарков')
+    parser.add_argument('--root', default='.', help='каталог с плейлистами для /files/')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--throttle', type=int, default=0, help='байт/с для тел файлов')
+    args = parser.parse_args()
+    server = StubServer(port=args.port, root=args.root, latency=args.latency,
+                        fail_rate=args.fail_rate, throttle=args.throttle)
+    print(f"🧪 Заглушка: {server.base_url}/files/<имя>, {server.base_url}/hls/<id>/master.m3u8")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
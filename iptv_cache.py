@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""Дисковый HTTP-кэш с условными запросами (ETag / Last-Modified) и LRU-вытеснением"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from iptv_fetch import http_get
+
+CACHE_DIR = os.environ.get('IPTV_CACHE_DIR', '.cache/http')
+CACHE_MAX_BYTES = int(os.environ.get('IPTV_CACHE_MAX_MB', '512')) * 1024 * 1024
+CHUNK = 64 * 1024
+
+
+class CachedResponse:
+    """Ответ, тело которого лежит на диске (из кэша или только что скачано)"""
+
+    def __init__(self, url, status_code, path=None, body=b'', from_cache=False, sha256=None):
+        self.url = url
+        self.status_code = status_code
+        self.path = path
+        self.sha256 = sha256
+        self._body = body
+        self.from_cache = from_cache
+
+    def iter_chunks(self, size=CHUNK):
+        if self.path is None:
+            yield self._body
+            return
+        with open(self.path, 'rb') as f:
+            while True:
+                chunk = f.read(size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def iter_lines(self):
+        """Построчное чтение тела без загрузки файла целиком"""
+        if self.path is None:
+            yield from self._body.decode('utf-8', 'replace').splitlines()
+            return
+        with open(self.path, 'r', encoding='utf-8', errors='replace', newline='') as f:
+            for line in f:
+                yield line.rstrip('\r\n')
+
+    @property
+    def content(self):
+        return b''.join(self.iter_chunks())
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', 'replace')
+
+
+class HttpCache:
+    """Кэш ответов по URL; тела хранятся по sha256 содержимого"""
+
+    def __init__(self, root=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(root, 'index.json')
+        self._index = None
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'errors': 0, 'bytes_downloaded': 0, 'bytes_saved': 0}
+
+    def _load(self):
+        if self._index is None:
+            try:
+                with open(self.index_path, encoding='utf-8') as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError):
+                self._index = {}
+        return self._index
+
+    def _object_path(self, sha):
+        return os.path.join(self.root, 'objects', sha[:2], sha)
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.stats[key] += n
+
+    def get(self, url, timeout=20, headers=None):
+        """GET с условными заголовками; при 304 возвращает тело из кэша"""
+        with self._lock:
+            entry = self._load().get(url)
+        if entry and not os.path.exists(self._object_path(entry['sha256'])):
+            entry = None
+
+        req_headers = dict(headers or {})
+        if entry:
+            if entry.get('etag'):
+                req_headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                req_headers['If-Modified-Since'] = entry['last_modified']
+
+        try:
+            r = http_get(url, timeout=timeout, headers=req_headers, stream=True)
+        except Exception:
+            self._count('errors')
+            raise
+
+        with r:
+            if r.status_code == 304 and entry:
+                self._count('hits')
+                self._count('bytes_saved', entry['size'])
+                with self._lock:
+                    entry['atime'] = time.time()
+                return CachedResponse(url, 200, self._object_path(entry['sha256']), from_cache=True,
+                                      sha256=entry['sha256'])
+
+            if r.status_code != 200:
+                self._count('misses')
+                body = r.content
+                self._count('bytes_downloaded', len(body))
+                return CachedResponse(url, r.status_code, body=body)
+
+            path, sha, size = self._store_body(r)
+            self._count('misses')
+            self._count('bytes_downloaded', size)
+            with self._lock:
+                index = self._load()
+                old = index.get(url)
+                index[url] = {
+                    'etag': r.headers.get('ETag', ''),
+                    'last_modified': r.headers.get('Last-Modified', ''),
+                    'sha256': sha,
+                    'size': size,
+                    'atime': time.time(),
+                }
+                # Тело по URL сменилось: прошлое удаляем, если на него не ссылается другой URL
+                if old and old['sha256'] != sha and not any(e['sha256'] == old['sha256'] for e in index.values()):
+                    self._remove_object(old['sha256'])
+            return CachedResponse(url, 200, path, sha256=sha)
+
+    def _remove_object(self, sha):
+        try:
+            os.remove(self._object_path(sha))
+        except OSError:
+            pass
+
+    def _store_body(self, r):
+        """Пишет тело во временный файл кусками и переносит его по хэшу содержимого"""
+        tmp_dir = os.path.join(self.root, 'tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        tmp = os.path.join(tmp_dir, f'{os.getpid()}-{threading.get_ident()}')
+        h = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp, 'wb') as f:
+                for chunk in r.iter_content(CHUNK):
+                    h.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+        except BaseException:
+            # Обрыв посреди тела - недописанный файл не оставляем
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        sha = h.hexdigest()
+        path = self._object_path(sha)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp, path)
+        return path, sha, size
+
+    def _objects_on_disk(self):
+        """{sha: размер} всех тел в objects/, включая те, на которые индекс уже не ссылается"""
+        objects = {}
+        for dirpath, _, filenames in os.walk(os.path.join(self.root, 'objects')):
+            for name in filenames:
+                try:
+                    objects[name] = os.path.getsize(os.path.join(dirpath, name))
+                except OSError:
+                    pass
+        return objects
+
+    def evict(self):
+        """Удаляет тела без записи в индексе и давно не использованные записи, пока кэш больше лимита;
+        размер считается по файлам на диске, а не по индексу"""
+        with self._lock:
+            index = self._load()
+            refs = {}
+            for e in index.values():
+                refs[e['sha256']] = refs.get(e['sha256'], 0) + 1
+            objects = self._objects_on_disk()
+            for sha in [sha for sha in objects if sha not in refs]:
+                self._remove_object(sha)
+                del objects[sha]
+            total = sum(objects.values())
+            for url, e in sorted(index.items(), key=lambda kv: kv[1]['atime']):
+                if total <= self.max_bytes:
+                    break
+                del index[url]
+                refs[e['sha256']] -= 1
+                if refs[e['sha256']] == 0:
+                    total -= objects.pop(e['sha256'], 0)
+                    self._remove_object(e['sha256'])
+
+    def save(self):
+        """Сохраняет индекс атомарно (временный файл + rename)"""
+        self.evict()
+        with self._lock:
+            if self._index is None:
+                return
+            os.makedirs(self.root, exist_ok=True)
+            tmp = self.index_path + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self._index, f)
+            os.replace(tmp, self.index_path)
+
+    def summary(self):
+        s = self.stats
+        total = s['hits'] + s['misses']
+        print(f"🗄️  HTTP кэш: {s['hits']}/{total} попаданий, ошибок {s['errors']}, "
+              f"скачано {s['bytes_downloaded'] // 1024} КБ, сэкономлено {s['bytes_saved'] // 1024} КБ")
+
+
+HTTP_CACHE = HttpCache()
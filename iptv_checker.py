@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""Сервис проверки ссылок для site/checker.html: пакет URL на вход, результаты потоком (NDJSON или SSE)"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import requests
+
+from iptv_fetch import HostLimiter, get_session, fetch_many, host_of
+from iptv_probe import SEGMENT_BYTES
+
+CHECK_DB = os.environ.get('IPTV_CHECK_DB', '.cache/linkcheck.sqlite')
+CHECK_WORKERS = int(os.environ.get('IPTV_CHECK_WORKERS', '200'))
+# Как в браузере: не больше 6 одновременных запросов к домену
+CHECK_PER_HOST = 6
+# Результат домена подставляется при сетевой ошибке, если он моложе DOMAIN_TTL секунд
+DOMAIN_TTL = 300
+MAX_BATCH = 50000
+# Страницы, которым разрешено обращаться к сервису (через запятую); остальные сайты получают 403
+CHECK_ORIGINS = os.environ.get('IPTV_CHECK_ORIGINS', 'https://iptvru2026.github.io')
+DEFAULT_UA = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+              '(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
+UA_POOL = [
+    DEFAULT_UA,
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Safari/605.1.15',
+    'Mozilla/5.0 (X11; Linux x86_64; rv:121.0) Gecko/20100101 Firefox/121.0',
+    'VLC/3.0.20 LibVLC/3.0.20',
+]
+# Серверы, которые не поддерживают HEAD, отвечают этими кодами - тогда повторяем запрос через GET
+HEAD_UNSUPPORTED = (405, 501)
+PLAYABLE_TYPES = ('video', 'application/vnd.apple.mpegurl', 'application/octet-stream')
+
+CHECK_LIMITER = HostLimiter(per_host=CHECK_PER_HOST, delay=0)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS domains (
+    domain TEXT PRIMARY KEY,
+    ok INTEGER NOT NULL,
+    status INTEGER,
+    ts REAL NOT NULL
+);
+'''
+
+
+class DomainCache:
+    """Последний результат по домену, общий для всех пользователей сервиса и переживающий перезапуск"""
+
+    def __init__(self, path=CHECK_DB, ttl=DOMAIN_TTL):
+        self.ttl = ttl
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._dirty = {}
+        self.entries = {d: (bool(ok), status, ts) for d, ok, status, ts in
+                        self.db.execute('SELECT domain, ok, status, ts FROM domains')}
+
+    def get(self, domain):
+        """(ok, status) свежего результата или None"""
+        entry = self.entries.get(domain)
+        if entry and time.time() - entry[2] < self.ttl:
+            return entry[:2]
+        return None
+
+    def put(self, domain, ok, status):
+        entry = (ok, status, time.time())
+        with self._lock:
+            self.entries[domain] = entry
+            self._dirty[domain] = entry
+
+    def flush(self):
+        with self._lock:
+            rows = [(d, int(ok), status, ts) for d, (ok, status, ts) in self._dirty.items()]
+            self._dirty.clear()
+            if rows:
+                self.db.executemany('INSERT OR REPLACE INTO domains VALUES (?, ?, ?, ?)', rows)
+                self.db.commit()
+
+
+def parse_options(raw):
+    """Настройки проверки из запроса; имена и значения по умолчанию - как в checker.html"""
+    raw = raw or {}
+    return {
+        'timeout': min(max(int(raw.get('timeout', 5000)), 300), 30000) / 1000,
+        'use_head': raw.get('useHead', True) is not False,
+        'head_get_fallback': raw.get('headGetFallback', True) is not False,
+        'use_range': raw.get('useRange', True) is not False,
+        'only_2kb': raw.get('checkOnly2KB', True) is not False,
+        'rotate_ua': bool(raw.get('rotateUA')),
+    }
+
+
+def _playable(r):
+    ct = r.headers.get('Content-Type', '')
+    return r.ok and (any(t in ct for t in PLAYABLE_TYPES) or r.status_code in (200, 206))
+
+
+def check_link(url, opts, cache):
+    """HEAD (при ошибке или отказе от HEAD - GET), Range на первые 2 КБ; при сетевой ошибке - свежий результат домена"""
+    headers = {
+        'Accept': 'video/mp4,video/x-matroska,application/vnd.apple.mpegurl,application/octet-stream,*/*',
+        'Cache-Control': 'no-cache',
+        'User-Agent': random.choice(UA_POOL) if opts['rotate_ua'] else DEFAULT_UA,
+    }
+    if opts['use_range'] and opts['only_2kb']:
+        headers['Range'] = f'bytes=0-{SEGMENT_BYTES - 1}'
+    domain = host_of(url)
+    session = get_session()
+    start = time.monotonic()
+    try:
+        with CHECK_LIMITER.slot(url):
+            r = None
+            if opts['use_head']:
+                try:
+                    r = session.head(url, headers=headers, timeout=opts['timeout'], allow_redirects=True)
+                    method = 'head'
+                    if r.status_code in HEAD_UNSUPPORTED and opts['head_get_fallback']:
+                        r = None
+                except requests.exceptions.RequestException:
+                    if not opts['head_get_fallback']:
+                        raise
+            if r is None:
+                method = 'get'
+                with session.get(url, headers=headers, timeout=opts['timeout'], stream=True) as r:
+                    if r.ok and opts['only_2kb']:
+                        next(r.iter_content(SEGMENT_BYTES), b'')
+        ok = _playable(r)
+        cache.put(domain, ok, r.status_code)
+        return {'ok': ok, 'status': r.status_code, 'via': method, 'ms': int((time.monotonic() - start) * 1000)}
+    except requests.exceptions.RequestException as e:
+        error = ('timeout' if isinstance(e, requests.exceptions.Timeout) else
+                 'ssl' if isinstance(e, requests.exceptions.SSLError) else
+                 'connection' if isinstance(e, requests.exceptions.ConnectionError) else 'error')
+        cached = cache.get(domain)
+        result = {'ok': False, 'status': 0, 'via': 'error', 'error': error,
+                  'ms': int((time.monotonic() - start) * 1000)}
+        if cached:
+            result.update(ok=cached[0], status=cached[1], via='domain_cache')
+        return result
+
+
+class CheckerHandler(BaseHTTPRequestHandler):
+    """POST /check {"urls": [...], "options": {...}} -> NDJSON построчно (или SSE при Accept: text/event-stream)"""
+    cache = None
+    origins = frozenset()
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _origin_allowed(self):
+        """Запрос без Origin (curl, скрипт) или со страницы из списка; чужой сайт не должен через сервис
+        обходить локальную сеть и читать коды ответов"""
+        origin = self.headers.get('Origin')
+        return origin is None or origin.lower() in self.origins
+
+    def _cors(self):
+        # Страница открывается с github.io, сервис - на localhost: разрешаем только известные страницы
+        origin = self.headers.get('Origin')
+        if not origin or origin.lower() not in self.origins:
+            return
+        self.send_header('Access-Control-Allow-Origin', origin)
+        self.send_header('Vary', 'Origin')
+        self.send_header('Access-Control-Allow-Methods', 'POST, GET, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Private-Network', 'true')
+
+    def do_OPTIONS(self):
+        if not self._origin_allowed():
+            return self._send_json(403, {'error': 'origin not allowed'})
+        self.send_response(204)
+        self._cors()
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        if urlsplit(self.path).path != '/health':
+            return self._send_json(404, {'error': 'not found'})
+        self._send_json(200, {'workers': CHECK_WORKERS, 'domains': len(self.cache.entries), 'ttl': self.cache.ttl})
+
+    def _send_json(self, status, obj):
+        body = json.dumps(obj).encode('utf-8')
+        self.send_response(status)
+        self._cors()
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _chunk(self, data):
+        self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+        self.wfile.flush()
+
+    def do_POST(self):
+        if not self._origin_allowed():
+            return self._send_json(403, {'error': 'origin not allowed'})
+        if urlsplit(self.path).path != '/check':
+            return self._send_json(404, {'error': 'not found'})
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            urls = [u for u in request['urls'] if isinstance(u, str)]
+            opts = parse_options(request.get('options'))
+        except (ValueError, KeyError, TypeError) as e:
+            return self._send_json(400, {'error': f'bad request: {e}'})
+        if len(urls) > MAX_BATCH:
+            return self._send_json(413, {'error': f'batch is limited to {MAX_BATCH} urls'})
+
+        sse = 'text/event-stream' in self.headers.get('Accept', '')
+        self.send_response(200)
+        self._cors()
+        self.send_header('Content-Type', 'text/event-stream' if sse else 'application/x-ndjson')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        gone = threading.Event()
+        stats = {'ok': 0, 'dead': 0}
+
+        def check(url):
+            # Клиент ушел (кнопка "Стоп") - оставшиеся ссылки не проверяем
+            if gone.is_set():
+                return None
+            return check_link(url, opts, self.cache)
+
+        def emit(i, url, result):
+            if gone.is_set():
+                return
+            result = result or {'ok': False, 'status': 0, 'via': 'error', 'error': 'error', 'ms': 0}
+            stats['ok' if result['ok'] else 'dead'] += 1
+            line = json.dumps({'i': i, 'url': url, **result}, ensure_ascii=False)
+            try:
+                self._chunk((f'data: {line}\n\n' if sse else line + '\n').encode('utf-8'))
+            except OSError:
+                gone.set()
+
+        start = time.monotonic()
+        fetch_many(urls, check, max_workers=CHECK_WORKERS, on_done=emit)
+        self.cache.flush()
+        if gone.is_set():
+            self.close_connection = True
+            return
+        done = json.dumps({'done': True, 'total': len(urls), **stats, 'seconds': round(time.monotonic() - start, 2)})
+        try:
+            self._chunk((f'event: done\ndata: {done}\n\n' if sse else done + '\n').encode('utf-8'))
+            self.wfile.write(b'0\r\n\r\n')
+        except OSError:
+            self.close_connection = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сервис пакетной проверки ссылок для site/checker.html')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--db', default=CHECK_DB, help='SQLite-кэш результатов по доменам')
+    parser.add_argument('--ttl', type=int, default=DOMAIN_TTL, help='сколько секунд результат домена считается свежим')
+    parser.add_argument('--origins', default=CHECK_ORIGINS,
+                        help='страницы, которым разрешен доступ, через запятую (IPTV_CHECK_ORIGINS)')
+    args = parser.parse_args()
+    origins = frozenset(o.strip().rstrip('/').lower() for o in args.origins.split(',') if o.strip())
+    handler = type('Handler', (CheckerHandler,), {'cache': DomainCache(args.db, args.ttl), 'origins': origins})
+    httpd = ThreadingHTTPServer((args.host, args.port), handler)
+    httpd.daemon_threads = True
+    print(f"🔌 Сервис проверки: http://{args.host}:{args.port}/check (в checker.html: «Сервис проверки»)")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        handler.cache.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""Определение страны канала по таблице: один скомпилированный regex на уровень, кэш по хосту и группе"""
+import re
+from functools import lru_cache
+from urllib.parse import urlparse
+
+# Порядок строк = приоритет при совпадении нескольких стран на одном уровне.
+# tvg    - значения атрибута tvg-country
+# line   - подстроки в строке #EXTINF (название, группа, прочие атрибуты)
+# name   - подстроки только в названии канала (если по строке не нашли)
+# tld    - доменные зоны хоста потока
+# hosts  - суффиксы хостов, однозначно указывающие на страну
+COUNTRIES = [
+    {'code': 'RU', 'flag': '🇷🇺', 'tvg': ['ru'], 'line': ['russia', ' рус ', 'россия'],
+     'name': [' ru', 'russia', 'russian'], 'tld': ['ru', 'su', 'xn--p1ai'], 'hosts': []},
+    {'code': 'US', 'flag': '🇺🇸', 'tvg': ['us'], 'line': ['usa', 'america', 'сша'],
+     'name': [' us', 'usa', 'american'], 'tld': ['us'], 'hosts': []},
+    {'code': 'UK', 'flag': '🇬🇧', 'tvg': ['uk', 'gb'], 'line': ['united kingdom', 'british', 'великобритания'],
+     'name': [' uk', 'british', 'england'], 'tld': ['uk'], 'hosts': []},
+    {'code': 'DE', 'flag': '🇩🇪', 'tvg': ['de'], 'line': ['germany', 'deutschland', 'германия'],
+     'name': [], 'tld': ['de'], 'hosts': []},
+    {'code': 'FR', 'flag': '🇫🇷', 'tvg': ['fr'], 'line': ['france', 'française', 'франция'],
+     'name': [' fr', 'france', 'french'], 'tld': ['fr'], 'hosts': []},
+    {'code': 'IT', 'flag': '🇮🇹', 'tvg': ['it'], 'line': ['italy', 'italia', 'италия'],
+     'name': [], 'tld': ['it'], 'hosts': []},
+    {'code': 'ES', 'flag': '🇪🇸', 'tvg': ['es'], 'line': ['spain', 'españa', 'испания'],
+     'name': [], 'tld': ['es'], 'hosts': []},
+    {'code': 'UA', 'flag': '🇺🇦', 'tvg': ['ua'], 'line': ['ukraine', 'украина'],
+     'name': [], 'tld': ['ua'], 'hosts': []},
+    {'code': 'PL', 'flag': '🇵🇱', 'tvg': ['pl'], 'line': ['poland', 'polska', 'польша'],
+     'name': [], 'tld': ['pl'], 'hosts': []},
+]
+DEFAULT_COUNTRY = 'INT'
+FLAGS = {c['code']: c['flag'] for c in COUNTRIES}
+FLAGS[DEFAULT_COUNTRY] = '🌍'
+
+_CODES = [c['code'] for c in COUNTRIES]
+_NONE = len(COUNTRIES)
+
+
+def _compile(field):
+    """Одно выражение на все ключевые слова уровня; слово -> ранг страны"""
+    ranks = {}
+    for rank, c in enumerate(COUNTRIES):
+        for kw in c[field]:
+            ranks.setdefault(kw.lower(), rank)
+    if not ranks:
+        return None, ranks
+    words = sorted(ranks, key=len, reverse=True)
+    # Lookahead находит и перекрывающиеся совпадения
+    return re.compile('(?=(' + '|'.join(map(re.escape, words)) + '))'), ranks
+
+
+_LINE_RE, _LINE_RANKS = _compile('line')
+_NAME_RE, _NAME_RANKS = _compile('name')
+_TVG = {}
+_TLD = {}
+_HOSTS = []
+for _rank, _c in enumerate(COUNTRIES):
+    for _v in _c['tvg']:
+        _TVG.setdefault(_v, _rank)
+    for _v in _c['tld']:
+        _TLD.setdefault(_v, _rank)
+    for _v in _c['hosts']:
+        _HOSTS.append((_v, _rank))
+
+
+def _scan(pattern, ranks, text):
+    if pattern is None:
+        return _NONE
+    best = _NONE
+    for m in pattern.finditer(text):
+        rank = ranks[m.group(1)]
+        if rank < best:
+            best = rank
+            if best == 0:
+                break
+    return best
+
+
+@lru_cache(maxsize=4096)
+def _tvg_rank(value):
+    best = _NONE
+    for part in re.split(r'[;,|\s]+', value.lower()):
+        best = min(best, _TVG.get(part, _NONE))
+    return best
+
+
+@lru_cache(maxsize=16384)
+def _group_rank(group):
+    return _scan(_LINE_RE, _LINE_RANKS, f' {group.lower()} ')
+
+
+@lru_cache(maxsize=16384)
+def _host_rank(host):
+    host = host.split(':')[0].rstrip('.')
+    for suffix, rank in _HOSTS:
+        if host == suffix or host.endswith('.' + suffix):
+            return rank
+    return _TLD.get(host.rsplit('.', 1)[-1], _NONE)
+
+
+def classify(line, attrs, name, url):
+    """Страна канала: tvg-country, затем строка #EXTINF, затем название, затем хост"""
+    rank = _tvg_rank(attrs.get('tvg-country', ''))
+    if rank < _NONE:
+        return _CODES[rank]
+
+    # Группа повторяется у тысяч каналов - ее ранг берем из кэша, остальное сканируем
+    text = ' '.join(v for k, v in attrs.items() if k not in ('tvg-logo', 'group-title', 'tvg-country'))
+    rank = min(_group_rank(attrs.get('group-title', '')),
+               _scan(_LINE_RE, _LINE_RANKS, f' {text} ,{name} '.lower()))
+    if rank == _NONE:
+        rank = _scan(_NAME_RE, _NAME_RANKS, name.lower())
+    if rank == _NONE:
+        rank = _host_rank(urlparse(url).netloc.lower())
+    return _CODES[rank] if rank < _NONE else DEFAULT_COUNTRY
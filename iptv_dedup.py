@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""Удаление дубликатов: канонические URL и ключ личности канала, дубликаты - как альтернативы"""
+import re
+import unicodedata
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+from iptv_store import ChannelStore
+
+# Параметры запроса, которые меняются от выдачи к выдаче: только известные имена токенов и подписей
+# (Flussonic, nginx secure_link, Akamai, Wowza, Nimble). Общие имена вроде key, e, ts, sid у разных
+# серверов означают разное - по ним разные потоки склеивались бы в один
+VOLATILE_PARAMS = {
+    'token', 'auth', 'auth_key', 'sig', 'signature', 'md5', 'expires',
+    'wmsauthsign', 'hdnts', 'hdnea', 'nimblesessionid',
+}
+DEFAULT_PORTS = {'http': '80', 'https': '443'}
+
+# Пометки качества/статуса в названиях: (360p), [Not 24/7], [Geo-blocked], HD, FHD...
+NAME_TAGS_RE = re.compile(r'\([^)]*\)|\[[^\]]*\]|\b(?:u?hd|fhd|sd|4k|8k|hevc|h265|\d{3,4}[pi])\b')
+NAME_JUNK_RE = re.compile(r'[^\w]+')
+# Хвостовые коды стран: "Milliy TV UZ" и "Milliy tv" - один канал
+COUNTRY_SUFFIXES = {
+    'ru', 'us', 'uk', 'gb', 'de', 'fr', 'it', 'es', 'ua', 'pl', 'uz', 'kz', 'by', 'az', 'am', 'ge',
+    'tr', 'md', 'kg', 'tj', 'tm', 'lv', 'lt', 'ee', 'int',
+}
+
+# Ранг статуса проверки: чем меньше, тем лучше
+STATUS_RANK = {'live': 0, None: 1, 'skipped': 1, 'dead': 2}
+
+
+def normalize_url(url):
+    """Канонический вид URL: без схемы, порта по умолчанию, фрагмента, токенов и с сортированным query"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    port = parts.port
+    netloc = host if port is None or str(port) == DEFAULT_PORTS.get(scheme) else f'{host}:{port}'
+    path = re.sub(r'/{2,}', '/', parts.path or '/')
+    if len(path) > 1:
+        path = path.rstrip('/')
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                   if k.lower() not in VOLATILE_PARAMS)
+    # http и https считаем одним потоком
+    return f'//{netloc}{path}' + (f'?{urlencode(query)}' if query else '')
+
+
+def normalize_name(name):
+    """Название без пометок качества/статуса, пунктуации и хвостового кода страны"""
+    text = unicodedata.normalize('NFKC', name).lower().replace('ё', 'е')
+    text = NAME_TAGS_RE.sub(' ', text)
+    words = NAME_JUNK_RE.sub(' ', text).split()
+    while len(words) > 1 and words[-1] in COUNTRY_SUFFIXES:
+        words.pop()
+    return ' '.join(words)
+
+
+def identity_keys(tvg_id, name, country):
+    """Ключи личности канала: по tvg-id и по нормализованному названию в пределах страны"""
+    keys = []
+    if tvg_id:
+        keys.append(('id', tvg_id.strip().lower()))
+    name = normalize_name(name)
+    if name:
+        keys.append(('name', name, country))
+    return keys
+
+
+def dedup_ids(store):
+    """Сводит дубликаты за один проход по хэш-индексам.
+
+    Точный повтор URL отбрасывается. Тот же поток под другим токеном или схемой (http/https) остается
+    альтернативой записи, где он встретился первым: rank_alternates выберет живую или https-копию.
+    Возвращает ([[id основного, id альтернатив...], ...], число отброшенных повторов URL).
+    """
+    seen = set()
+    by_url = {}
+    by_identity = {}
+    entries = []
+    dropped = 0
+
+    for i in range(len(store)):
+        url = store.urls[i]
+        if url in seen:
+            dropped += 1
+            continue
+        seen.add(url)
+        ukey = normalize_url(url)
+        entry = by_url.get(ukey)
+        if entry is not None:
+            entries[entry].append(i)
+            continue
+
+        keys = identity_keys(store.tvg_ids[i], store.names[i], store.country(i))
+        for key in keys:
+            entry = by_identity.get(key)
+            if entry is not None:
+                break
+        if entry is None:
+            entry = len(entries)
+            entries.append([i])
+        else:
+            entries[entry].append(i)
+        by_url[ukey] = entry
+        for key in keys:
+            by_identity.setdefault(key, entry)
+
+    return entries, dropped
+
+
+def _link_alternates(primary, alternates):
+    primary['alternates'] = alternates
+    for alt in alternates:
+        if not primary['tvg_id'] and alt['tvg_id']:
+            primary['tvg_id'] = alt['tvg_id']
+        if not primary['logo'] and alt['logo']:
+            primary['logo'] = alt['logo']
+    return primary
+
+
+def materialize(store, entries):
+    """Записи-словари для уникальных каналов; лишние потоки - в c['alternates']"""
+    return [_link_alternates(store.record(ids[0]), [store.record(j) for j in ids[1:]]) for ids in entries]
+
+
+def dedup_channels(channels):
+    """То же для списка словарей: возвращает (уникальные записи, число отброшенных повторов URL)"""
+    store = ChannelStore()
+    store.extend(channels)
+    entries, dropped = dedup_ids(store)
+    return [_link_alternates(channels[ids[0]], [channels[j] for j in ids[1:]]) for ids in entries], dropped
+
+
+def stream_rank(c, order, neutral=0.0):
+    """Ключ сортировки потока: живой, качество с учетом TTFB, быстрее, https, раньше найден.
+    Поток без разбора манифеста (прямой TS/MP4, не дошла очередь) получает нейтральную оценку neutral,
+    а не место позади всех разобранных"""
+    probe = c.get('probe') or {}
+    variant = c.get('variant')
+    # Манифест не открылся - в конец своей группы статуса
+    if variant and 'score' not in variant:
+        quality = (1, 0)
+    else:
+        quality = (0, -(variant['score'] if variant else neutral))
+    return (STATUS_RANK.get(probe.get('status'), 1), *quality, probe.get('latency') or 0,
+            not c['url'].startswith('https://'), order)
+
+
+def _neutral_score(streams):
+    """Медиана оценок разобранных потоков записи: непроверенный поток считаем средним среди них"""
+    scores = sorted(s['variant']['score'] for s in streams if 'score' in (s.get('variant') or {}))
+    if not scores:
+        return 0.0
+    mid = len(scores) // 2
+    return scores[mid] if len(scores) % 2 else (scores[mid - 1] + scores[mid]) / 2
+
+
+def rank_alternates(entries, live_only=False):
+    """Пересобирает каждую запись: лучший поток - основной, остальные по убыванию качества"""
+    ranked = []
+    for entry in entries:
+        streams = [entry] + entry.pop('alternates', [])
+        for s in streams:
+            s.pop('alternates', None)
+        if live_only:
+            streams = [s for s in streams if (s.get('probe') or {}).get('status') == 'live']
+            if not streams:
+                continue
+        order = {id(s): i for i, s in enumerate(streams)}
+        neutral = _neutral_score(streams)
+        streams.sort(key=lambda s: stream_rank(s, order[id(s)], neutral))
+        best = streams[0]
+        best['alternates'] = streams[1:]
+        ranked.append(best)
+    return ranked
+
+
+def iter_streams(entries):
+    """Все потоки записей: основной, затем альтернативы"""
+    for entry in entries:
+        yield entry
+        yield from entry.get('alternates', ())
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""Поиск источников: несколько поисковиков и запросов параллельно, кэш выдачи, рейтинг по отдаче каналов"""
+import json
+import os
+import re
+import threading
+import time
+from urllib.parse import quote_plus, unquote
+
+from bs4 import BeautifulSoup
+
+from iptv_fetch import http_get, fetch_many
+
+DISCOVERY_DB = os.environ.get('IPTV_DISCOVERY_DB', '.cache/discovery.json')
+# Сколько источников загружать за запуск (раньше: 15 найденных + 3 надежных)
+DISCOVERY_TOP_N = int(os.environ.get('IPTV_DISCOVERY_TOP_N', '18'))
+# Сколько мест из TOP_N оставлять новым, еще не загружавшимся источникам
+EXPLORE_SLOTS = int(os.environ.get('IPTV_DISCOVERY_EXPLORE', '4'))
+# Таймаут одного запроса к поисковику и общий бюджет времени на поиск, секунд
+DISCOVERY_TIMEOUT = float(os.environ.get('IPTV_DISCOVERY_TIMEOUT', '12'))
+DISCOVERY_DEADLINE = float(os.environ.get('IPTV_DISCOVERY_DEADLINE', '30'))
+# Выдача поисковика считается свежей QUERY_TTL секунд; устаревшая используется, если поиск не ответил
+QUERY_TTL = 6 * 3600
+# Вес последнего запуска в скользящей средней отдачи источника
+YIELD_ALPHA = 0.5
+# Источник, не отдающий каналов FORGET_AFTER подряд запусков, выпадает из кандидатов,
+# но раз в FORGET_RETRY секунд снова пробуется на месте нового (источник мог ожить)
+FORGET_AFTER = 5
+FORGET_RETRY = 7 * 24 * 3600
+
+HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
+
+ENGINES = {
+    'duckduckgo': ('https://html.duckduckgo.com/html/?q={q}', 'a.result__a'),
+    'duckduckgo_lite': ('https://lite.duckduckgo.com/lite/?q={q}', 'a.result-link'),
+    'bing': ('https://www.bing.com/search?q={q}&count=50', 'li.b_algo h2 a'),
+}
+
+QUERIES = [
+    'site:raw.githubusercontent.com iptv m3u',
+    'site:raw.githubusercontent.com iptv playlist m3u8',
+    'site:raw.githubusercontent.com iptv russia m3u',
+    'site:raw.githubusercontent.com free iptv channels m3u',
+]
+
+RAW_URL_RE = re.compile(r'https?://raw\.githubusercontent\.com/[^\s"\'<>?#&]+?\.m3u8?(?![\w.])')
+
+
+def extract_sources(html, selector):
+    """Ссылки на raw-плейлисты из страницы выдачи (в т.ч. завернутые в редирект поисковика)"""
+    soup = BeautifulSoup(html, 'html.parser')
+    found = []
+    for link in soup.select(selector) or soup.find_all('a'):
+        found.extend(RAW_URL_RE.findall(unquote(link.get('href', ''))))
+    return list(dict.fromkeys(found))
+
+
+class SourceDiscovery:
+    """Кэш выдачи поисковиков и история отдачи источников между запусками"""
+
+    def __init__(self, path=DISCOVERY_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        self.queries = data.get('queries', {})
+        self.sources = data.get('sources', {})
+        self.stats = {'fresh': 0, 'cached': 0, 'stale': 0, 'failed': 0}
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _query(self, engine, query, deadline):
+        key = f'{engine}|{query}'
+        entry = self.queries.get(key)
+        if entry and time.time() - entry['time'] < QUERY_TTL:
+            self._count('cached')
+            return entry['urls']
+
+        remaining = deadline - time.monotonic()
+        template, selector = ENGINES[engine]
+        try:
+            if remaining <= 1:
+                raise TimeoutError('deadline')
+            # Один повтор: при неудаче есть прошлая выдача, а общий срок поиска короткий
+            r = http_get(template.format(q=quote_plus(query)), headers=HEADERS,
+                         timeout=min(DISCOVERY_TIMEOUT, remaining), retries=1)
+            if r.status_code != 200:
+                raise IOError(f'HTTP {r.status_code}')
+            urls = extract_sources(r.text, selector)
+        except Exception:
+            # Поисковик не ответил или закрыл доступ - берем прошлую выдачу, если она есть
+            self._count('stale' if entry else 'failed')
+            return entry['urls'] if entry else []
+
+        self._count('fresh')
+        with self._lock:
+            self.queries[key] = {'time': time.time(), 'urls': urls}
+        return urls
+
+    def search(self, engines=None, queries=None, deadline_s=DISCOVERY_DEADLINE):
+        """Все пары (поисковик, запрос) параллельно; URL в порядке первого появления"""
+        deadline = time.monotonic() + deadline_s
+        pairs = [(e, q) for q in (queries or QUERIES) for e in (engines or ENGINES)]
+        # fetch_many группирует задания по хосту: ключом служит URL поисковика
+        keys = [ENGINES[e][0].format(q=quote_plus(q)) for e, q in pairs]
+        by_key = dict(zip(keys, pairs))
+        results = fetch_many(keys, lambda k: self._query(*by_key[k], deadline))
+        found = list(dict.fromkeys(url for urls in results if urls for url in urls))
+        s = self.stats
+        print(f"   Поиск: {len(found)} кандидатов (запросов: свежих {s['fresh']}, из кэша {s['cached']}, "
+              f"устаревших {s['stale']}, без ответа {s['failed']})")
+        return found
+
+    def score(self, url):
+        """Ожидаемая отдача уникальных (живых) каналов на секунду загрузки"""
+        s = self.sources[url]
+        return s['yield'] / (1.0 + s['seconds'])
+
+    def rank(self, candidates, top_n=DISCOVERY_TOP_N, explore=EXPLORE_SLOTS, pinned=()):
+        """Лучшие по истории источники плюс несколько новых; источники без отдачи отбрасываются,
+        кроме pinned (надежные репозитории) и давно не пробованных - те идут на места новых"""
+        now = time.time()
+        pinned = set(pinned)
+        known, new = [], []
+        for url in dict.fromkeys(candidates):
+            s = self.sources.get(url)
+            if s is None:
+                new.append(url)
+            elif s['misses'] < FORGET_AFTER or url in pinned:
+                known.append(url)
+            elif now - s.get('last_run', 0) >= FORGET_RETRY:
+                new.append(url)
+        known.sort(key=self.score, reverse=True)
+        explore = min(explore, len(new))
+        chosen = known[:top_n - explore]
+        # Если проверенных мало, свободные места тоже отдаем новым (в порядке выдачи)
+        chosen += new[:top_n - len(chosen)]
+        return chosen
+
+    def record(self, sources):
+        """Обновляет историю по статистике источников запуска ({url: {unique, live, seconds, status, ...}});
+        промахом считается только успешная загрузка без каналов - сбой сети или отключенный хост не в счет"""
+        now = time.time()
+        for url, m in sources.items():
+            if 'unique' not in m:
+                continue
+            status = m.get('status', 200)
+            if status == 0 or status == 429 or status >= 500:
+                # Временная ошибка: историю отдачи не трогаем
+                if url in self.sources:
+                    self.sources[url]['failures'] = self.sources[url].get('failures', 0) + 1
+                continue
+            got = m.get('live', m['unique'])
+            s = self.sources.setdefault(url, {'runs': 0, 'yield': float(got), 'seconds': m.get('seconds', 0.0),
+                                              'misses': 0})
+            s['runs'] += 1
+            s['yield'] = YIELD_ALPHA * got + (1 - YIELD_ALPHA) * s['yield']
+            s['seconds'] = YIELD_ALPHA * m.get('seconds', 0.0) + (1 - YIELD_ALPHA) * s['seconds']
+            s['misses'] = 0 if got else s['misses'] + 1
+            s['last_run'] = now
+
+    def save(self):
+        """Сохраняет кэш атомарно; выдачу старше суток не храним"""
+        queries = {k: v for k, v in self.queries.items() if time.time() - v['time'] < 4 * QUERY_TTL}
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'queries': queries, 'sources': self.sources}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""Потоковая загрузка EPG (XMLTV) и индекс tvg-id / названий каналов на диске"""
+import calendar
+import gzip
+import os
+import sqlite3
+import time
+import xml.etree.ElementTree as ET
+
+from iptv_cache import HTTP_CACHE
+from iptv_dedup import normalize_name
+from iptv_fetch import fetch_many
+
+EPG_INDEX_DB = os.environ.get('IPTV_EPG_DB', '.cache/epg_index.sqlite')
+# Сколько каналов / названий копить перед записью в индекс
+EPG_BATCH = 5000
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sources (
+    url TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    indexed_at REAL NOT NULL,
+    channels INTEGER NOT NULL,
+    programmes INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS channels (
+    source TEXT NOT NULL,
+    id TEXT NOT NULL,
+    programmes INTEGER NOT NULL,
+    first_start INTEGER,
+    last_stop INTEGER,
+    PRIMARY KEY (source, id)
+);
+CREATE TABLE IF NOT EXISTS names (
+    source TEXT NOT NULL,
+    name TEXT NOT NULL,
+    id TEXT NOT NULL,
+    PRIMARY KEY (source, name, id)
+);
+'''
+
+
+def xmltv_time(value):
+    """'20240101120000 +0300' -> unix time (без strptime: программ в гиде миллионы)"""
+    try:
+        ts = calendar.timegm((int(value[0:4]), int(value[4:6]), int(value[6:8]),
+                              int(value[8:10]), int(value[10:12]), int(value[12:14] or 0), 0, 0, 0))
+    except (ValueError, IndexError):
+        return None
+    tz = value[14:].strip()
+    if len(tz) == 5 and tz[0] in '+-' and tz[1:].isdigit():
+        offset = int(tz[1:3]) * 3600 + int(tz[3:5]) * 60
+        ts -= offset if tz[0] == '+' else -offset
+    return ts
+
+
+def _open_body(path):
+    """Файл тела: gzip распаковывается на лету, без чтения целиком"""
+    with open(path, 'rb') as f:
+        magic = f.read(2)
+    return gzip.open(path, 'rb') if magic == b'\x1f\x8b' else open(path, 'rb')
+
+
+def iter_xmltv(fileobj):
+    """Потоковый разбор XMLTV: ('channel', id, [имена]) и ('programme', канал, start, stop)"""
+    root = None
+    for event, elem in ET.iterparse(fileobj, events=('start', 'end')):
+        if root is None:
+            root = elem
+            continue
+        if event != 'end':
+            continue
+        if elem.tag == 'channel':
+            names = [n.text.strip() for n in elem.findall('display-name') if n.text and n.text.strip()]
+            yield 'channel', elem.get('id', ''), names
+        elif elem.tag == 'programme':
+            yield 'programme', elem.get('channel', ''), elem.get('start', ''), elem.get('stop', '')
+        else:
+            continue
+        # Разобранные элементы сразу выбрасываем, чтобы память не росла с размером гида
+        elem.clear()
+        root.clear()
+
+
+class EpgIndex:
+    """Индекс гидов в SQLite: какие tvg-id есть, под какими названиями и с каким покрытием"""
+
+    def __init__(self, path=EPG_INDEX_DB):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self.stats = {'matched': 0, 'filled': 0, 'corrected': 0, 'missing': 0}
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def ingest(self, url, path, sha):
+        """Индексирует гид, если его содержимое изменилось с прошлого раза"""
+        row = self.db.execute('SELECT sha256 FROM sources WHERE url = ?', (url,)).fetchone()
+        if row and row[0] == sha:
+            return False
+
+        # В памяти только пачка: каналы и названия уходят в базу по мере разбора, одной транзакцией
+        channels = {}
+        names = []
+        programmes = 0
+        with self.db:
+            self.db.execute('DELETE FROM channels WHERE source = ?', (url,))
+            self.db.execute('DELETE FROM names WHERE source = ?', (url,))
+            with _open_body(path) as f:
+                for item in iter_xmltv(f):
+                    if item[0] == 'channel':
+                        _, cid, display = item
+                        channels.setdefault(cid, [0, None, None])
+                        for name in display:
+                            key = normalize_name(name)
+                            if key:
+                                names.append((url, key, cid))
+                    else:
+                        _, cid, start, stop = item
+                        programmes += 1
+                        entry = channels.setdefault(cid, [0, None, None])
+                        entry[0] += 1
+                        start, stop = xmltv_time(start), xmltv_time(stop)
+                        if start is not None and (entry[1] is None or start < entry[1]):
+                            entry[1] = start
+                        if stop is not None and (entry[2] is None or stop > entry[2]):
+                            entry[2] = stop
+                    if len(channels) >= EPG_BATCH or len(names) >= EPG_BATCH:
+                        self._flush(url, channels, names)
+            self._flush(url, channels, names)
+            count = self.db.execute('SELECT COUNT(*) FROM channels WHERE source = ?', (url,)).fetchone()[0]
+            self.db.execute('INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?)',
+                            (url, sha, time.time(), count, programmes))
+        return True
+
+    def _flush(self, url, channels, names):
+        """Пишет пачку; программы канала могут встретиться в разных пачках - счетчики складываются"""
+        self.db.executemany(
+            'INSERT INTO channels VALUES (?, ?, ?, ?, ?) ON CONFLICT (source, id) DO UPDATE SET '
+            'programmes = programmes + excluded.programmes, '
+            'first_start = MIN(COALESCE(first_start, excluded.first_start), '
+            'COALESCE(excluded.first_start, first_start)), '
+            'last_stop = MAX(COALESCE(last_stop, excluded.last_stop), '
+            'COALESCE(excluded.last_stop, last_stop))',
+            ((url, cid, *entry) for cid, entry in channels.items()))
+        self.db.executemany('INSERT OR IGNORE INTO names VALUES (?, ?, ?)', names)
+        channels.clear()
+        names.clear()
+
+    def coverage(self, url):
+        """(каналов, программ, начало, конец) для гида"""
+        return self.db.execute(
+            'SELECT COUNT(*), COALESCE(SUM(programmes), 0), MIN(first_start), MAX(last_stop) '
+            'FROM channels WHERE source = ?', (url,)).fetchone()
+
+    def has_id(self, source, tvg_id):
+        return self.db.execute('SELECT 1 FROM channels WHERE source = ? AND id = ?',
+                               (source, tvg_id)).fetchone() is not None
+
+    def find_id(self, source, name):
+        """tvg-id по названию; при нескольких кандидатах - канал с наибольшим числом программ"""
+        row = self.db.execute(
+            'SELECT n.id FROM names n LEFT JOIN channels c ON c.source = n.source AND c.id = n.id '
+            'WHERE n.source = ? AND n.name = ? ORDER BY COALESCE(c.programmes, 0) DESC, n.id LIMIT 1',
+            (source, normalize_name(name))).fetchone()
+        return row[0] if row else None
+
+    def apply(self, channels, source):
+        """Заполняет или исправляет tvg-id каналов по гиду source"""
+        for c in channels:
+            if c['tvg_id'] and self.has_id(source, c['tvg_id']):
+                self.stats['matched'] += 1
+                continue
+            found = self.find_id(source, c['name'])
+            if found is None:
+                self.stats['missing'] += 1
+                continue
+            self.stats['corrected' if c['tvg_id'] else 'filled'] += 1
+            c['tvg_id'] = found
+
+
+def build_epg_index(urls):
+    """Скачивает гиды (через общий HTTP-кэш) и обновляет индекс"""
+    urls = list(dict.fromkeys(urls))
+    print(f"📅 Индексация EPG: {len(urls)} гидов...")
+    index = EpgIndex()
+
+    def fetch(url):
+        r = HTTP_CACHE.get(url, timeout=120, headers={'User-Agent': 'Mozilla/5.0'})
+        return r if r.status_code == 200 and r.path else None
+
+    for url, r in zip(urls, fetch_many(urls, fetch)):
+        if r is None:
+            print(f"   {url[:60]}: недоступен")
+            continue
+        try:
+            changed = index.ingest(url, r.path, r.sha256)
+        except (ET.ParseError, OSError, EOFError) as e:
+            print(f"   {url[:60]}: ошибка разбора: {e}")
+            continue
+        count, programmes, start, stop = index.coverage(url)
+        window = ''
+        if start and stop:
+            window = f", {time.strftime('%d.%m', time.gmtime(start))}-{time.strftime('%d.%m', time.gmtime(stop))}"
+        note = '' if changed else ' (без изменений)'
+        print(f"   {url[:60]}: {count} каналов, {programmes} программ{window}{note}")
+    return index
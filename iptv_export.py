@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""Экспорт за один проход: каждый канал уходит сразу во все выбранные форматы.
+
+m3u     - playlists/iptv_<страна>.m3u (обязателен: на него ссылаются сайт и дельты)
+m3u.gz  - те же плейлисты, заранее сжатые
+jsonl   - export/channels.jsonl, канал с альтернативами на строку
+sqlite  - export/catalogue.sqlite с индексами по стране, группе и tvg-id
+
+По умолчанию пишется только m3u; остальные форматы включаются через --export или IPTV_EXPORT.
+
+Все файлы пишутся во временные и публикуются переименованием через OutputSet:
+потребитель никогда не видит недописанный файл, а неизмененные файлы не переписываются.
+"""
+import json
+import os
+import sqlite3
+
+# По умолчанию только плейлисты: остальные форматы (в том числе двоичный sqlite) публикуются по запросу,
+# иначе каждый плановый запуск добавлял бы их в историю репозитория
+EXPORT_FORMATS = os.environ.get('IPTV_EXPORT', 'm3u')
+EXPORT_DIR = os.environ.get('IPTV_EXPORT_DIR', 'export')
+SQLITE_BATCH = 5000
+CATALOGUE_FORMAT = 1
+
+CATALOGUE_SCHEMA = '''
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE logos (id INTEGER PRIMARY KEY, logo TEXT NOT NULL);
+CREATE TABLE channels (
+    id INTEGER PRIMARY KEY,
+    country TEXT NOT NULL,
+    name TEXT NOT NULL,
+    group_title TEXT NOT NULL,
+    tvg_id TEXT NOT NULL,
+    logo_id INTEGER REFERENCES logos(id),
+    url TEXT NOT NULL,
+    live INTEGER,
+    resolution TEXT,
+    bitrate INTEGER
+);
+CREATE TABLE streams (
+    channel_id INTEGER NOT NULL REFERENCES channels(id),
+    position INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    opts TEXT,
+    live INTEGER,
+    latency INTEGER,
+    resolution TEXT,
+    bitrate INTEGER,
+    PRIMARY KEY (channel_id, position)
+) WITHOUT ROWID;
+'''
+# Индексы строятся после вставки всех строк - так быстрее
+CATALOGUE_INDEXES = '''
+CREATE INDEX channels_country ON channels(country);
+CREATE INDEX channels_group ON channels(group_title);
+CREATE INDEX channels_tvg_id ON channels(tvg_id);
+CREATE INDEX streams_url ON streams(url);
+'''
+
+
+def parse_formats(spec):
+    """'jsonl,sqlite' -> ['m3u', 'jsonl', 'sqlite']; ValueError для неизвестного формата"""
+    formats = [f.strip().lower() for f in spec.split(',') if f.strip()]
+    unknown = [f for f in formats if f not in SINKS]
+    if unknown:
+        raise ValueError(f'неизвестные форматы экспорта: {", ".join(unknown)} (есть: {", ".join(SINKS)})')
+    return list(dict.fromkeys(['m3u'] + formats))
+
+
+def _live(s):
+    status = (s.get('probe') or {}).get('status')
+    return None if status is None else int(status == 'live')
+
+
+def _stream(s):
+    """Поля потока, которые есть у этого потока (пустые не пишем)"""
+    variant = s.get('variant') or {}
+    probe = s.get('probe') or {}
+    row = {'url': s['url']}
+    if s['opts']:
+        row['opts'] = list(s['opts'])
+    if probe.get('status'):
+        row['live'] = probe['status'] == 'live'
+        row['latency'] = probe.get('latency') or 0
+    if variant.get('resolution'):
+        row['resolution'] = variant['resolution']
+    if variant.get('bandwidth'):
+        row['bitrate'] = variant['bandwidth']
+    return row
+
+
+class M3USink:
+    """Плейлист страны; gzip_level - сжатая копия .m3u.gz"""
+
+    def __init__(self, outputs, gzip_level=None):
+        self.outputs = outputs
+        self.gzip_level = gzip_level
+        self.suffix = '.m3u.gz' if gzip_level else '.m3u'
+        self.file = None
+
+    def path(self, country):
+        return f'playlists/iptv_{country.lower()}{self.suffix}'
+
+    def begin(self, country, header):
+        self.file = self.outputs.create(self.path(country), self.gzip_level)
+        self.file.write(header)
+
+    def add(self, country, c, text):
+        self.file.write(text)
+
+    def end(self, country):
+        self.file.close()
+        self.file = None
+
+    def close(self):
+        pass
+
+    def abort(self):
+        if self.file:
+            self.file.abort()
+
+
+class JSONLSink:
+    """Все каналы одним файлом JSON Lines: основной поток и альтернативы"""
+
+    def __init__(self, outputs, root=EXPORT_DIR):
+        self.file = outputs.create(os.path.join(root, 'channels.jsonl'))
+
+    def begin(self, country, header):
+        pass
+
+    def add(self, country, c, text):
+        self.file.write(json.dumps({
+            'country': country, 'name': c['name'], 'group': c['group'], 'tvg_id': c['tvg_id'],
+            'logo': c['logo'], **_stream(c), 'alternates': [_stream(a) for a in c.get('alternates', ())],
+        }, ensure_ascii=False, separators=(',', ':')) + '\n')
+
+    def end(self, country):
+        pass
+
+    def close(self):
+        self.file.close()
+
+    def abort(self):
+        self.file.abort()
+
+
+class SQLiteSink:
+    """Каталог для запросов без разбора M3U: каналы, потоки и логотипы с индексами"""
+
+    def __init__(self, outputs, root=EXPORT_DIR):
+        self.outputs = outputs
+        self.path = os.path.join(root, 'catalogue.sqlite')
+        self.tmp = self.path + '.tmp'
+        os.makedirs(root, exist_ok=True)
+        if os.path.exists(self.tmp):
+            os.remove(self.tmp)
+        self.db = sqlite3.connect(self.tmp)
+        self.db.executescript('PRAGMA journal_mode = OFF; PRAGMA synchronous = OFF;' + CATALOGUE_SCHEMA)
+        self.logos = {}
+        self.count = 0
+        self.channels = []
+        self.streams = []
+
+    def _logo_id(self, logo):
+        if not logo:
+            return None
+        i = self.logos.get(logo)
+        if i is None:
+            i = self.logos[logo] = len(self.logos) + 1
+            self.db.execute('INSERT INTO logos VALUES (?, ?)', (i, logo))
+        return i
+
+    def begin(self, country, header):
+        pass
+
+    def add(self, country, c, text):
+        self.count += 1
+        channel_id = self.count
+        variant = c.get('variant') or {}
+        self.channels.append((channel_id, country, c['name'], c['group'], c['tvg_id'], self._logo_id(c['logo']),
+                              c['url'], _live(c), variant.get('resolution'), variant.get('bandwidth')))
+        for position, s in enumerate([c, *c.get('alternates', ())]):
+            v = s.get('variant') or {}
+            self.streams.append((channel_id, position, s['url'], '\n'.join(s['opts']) or None, _live(s),
+                                 (s.get('probe') or {}).get('latency'), v.get('resolution'), v.get('bandwidth')))
+        # Пачка меряется потоками: у канала бывают десятки альтернатив
+        if len(self.streams) >= SQLITE_BATCH:
+            self._flush()
+
+    def _flush(self):
+        self.db.executemany('INSERT INTO channels VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', self.channels)
+        self.db.executemany('INSERT INTO streams VALUES (?, ?, ?, ?, ?, ?, ?, ?)', self.streams)
+        self.channels = []
+        self.streams = []
+
+    def end(self, country):
+        pass
+
+    def close(self):
+        self._flush()
+        self.db.executemany('INSERT INTO meta VALUES (?, ?)', [('format', str(CATALOGUE_FORMAT))])
+        self.db.executescript(CATALOGUE_INDEXES)
+        self.db.commit()
+        self.db.close()
+        self.outputs.commit(self.tmp, self.path)
+
+    def abort(self):
+        self.db.close()
+        os.remove(self.tmp)
+
+
+SINKS = {
+    'm3u': M3USink,
+    'm3u.gz': lambda outputs: M3USink(outputs, gzip_level=9),
+    'jsonl': JSONLSink,
+    'sqlite': SQLiteSink,
+}
+
+
+class Exporter:
+    """Рассылает каждый канал во все форматы; при ошибке черновики удаляются, опубликованное не трогается"""
+
+    def __init__(self, outputs, formats=('m3u',)):
+        self.formats = list(formats)
+        self.sinks = []
+        try:
+            for name in self.formats:
+                self.sinks.append(SINKS[name](outputs))
+        except BaseException:
+            self.abort()
+            raise
+
+    def begin(self, country, header):
+        for sink in self.sinks:
+            sink.begin(country, header)
+
+    def add(self, country, c, text):
+        for sink in self.sinks:
+            sink.add(country, c, text)
+
+    def end(self, country):
+        for sink in self.sinks:
+            sink.end(country)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+    def abort(self):
+        for sink in self.sinks:
+            try:
+                sink.abort()
+            except OSError:
+                pass
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""Параллельная загрузка: общий пул соединений, лимиты на хост и общий лимит запросов,
+таймауты по задержкам хоста, повторы в пределах общего бюджета и автоматы отключения хостов"""
+import json
+import os
+import random
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Сколько запросов может выполняться одновременно на весь процесс
+MAX_IN_FLIGHT = int(os.environ.get('IPTV_MAX_IN_FLIGHT', '16'))
+# Сколько одновременных запросов допускаем к одному хосту
+PER_HOST_LIMIT = int(os.environ.get('IPTV_PER_HOST_LIMIT', '4'))
+# Минимальный интервал между запросами к одному хосту (вежливость вместо общего sleep)
+HOST_DELAY = float(os.environ.get('IPTV_HOST_DELAY', '0.3'))
+
+# Состояние хостов между запусками: задержки и автоматы отключения
+HOST_STATE = os.environ.get('IPTV_HOST_STATE', '.cache/hosts.json')
+# Таймаут хоста - p95 задержки ответа с запасом, но не меньше MIN_TIMEOUT и не больше заданного вызовом
+LATENCY_SAMPLES = 20
+MIN_SAMPLES = 5
+TIMEOUT_FACTOR = 4
+MIN_TIMEOUT = 3.0
+# Повторы временных ошибок: не больше RETRY_MAX на запрос, пауза - случайная до base * 2^попытка
+RETRY_MAX = 2
+RETRY_BASE = 0.5
+RETRY_CAP = 8.0
+# Общий бюджет повторов: RETRY_RATIO повтора на каждый запрос плюс запас RETRY_RESERVE на запуск
+RETRY_RATIO = 0.1
+RETRY_RESERVE = 20
+TRANSIENT_STATUS = (429, 502, 503, 504)
+# Автомат: BREAKER_THRESHOLD отказов подряд - хост отключается на BREAKER_COOLDOWN, каждый повтор вдвое дольше
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 300
+BREAKER_MAX = 24 * 3600
+# Хосты, к которым не обращались дольше, из состояния удаляются
+HOST_FORGET_AFTER = 14 * 24 * 3600
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Общая сессия requests с пулом соединений на все потоки"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            s = requests.Session()
+            # pool_connections - сколько пулов хостов держать, pool_maxsize - соединений на хост
+            adapter = HTTPAdapter(pool_connections=256, pool_maxsize=MAX_IN_FLIGHT)
+            s.mount('http://', adapter)
+            s.mount('https://', adapter)
+            _session = s
+    return _session
+
+
+def host_of(url):
+    """Хост из URL в нижнем регистре"""
+    return urlparse(url).netloc.lower()
+
+
+class HostLimiter:
+    """Ограничивает параллелизм и частоту запросов к каждому хосту"""
+
+    def __init__(self, per_host=PER_HOST_LIMIT, delay=HOST_DELAY):
+        self.per_host = per_host
+        self.delay = delay
+        self._sems = {}
+        self._next_start = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, url):
+        """Занимает место хоста (выдерживая интервал); возвращает функцию освобождения - повторный вызов безвреден"""
+        host = host_of(url)
+        with self._lock:
+            sem = self._sems.get(host)
+            if sem is None:
+                sem = self._sems[host] = threading.BoundedSemaphore(self.per_host)
+        sem.acquire()
+        # Резервируем момент старта, чтобы соседние запросы к хосту шли с интервалом
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start.get(host, 0.0))
+            self._next_start[host] = start + self.delay
+        if start > now:
+            time.sleep(start - now)
+        once = threading.Lock()
+
+        def release():
+            if once.acquire(blocking=False):
+                sem.release()
+        return release
+
+    @contextmanager
+    def slot(self, url):
+        release = self.acquire(url)
+        try:
+            yield
+        finally:
+            release()
+
+
+def _release_on_close(response, release):
+    """Место хоста остается занятым, пока тело потокового ответа не дочитано и ответ не закрыт"""
+    close = response.close
+
+    def closing():
+        try:
+            close()
+        finally:
+            release()
+    response.close = closing
+    # Страховка для ответа, который бросили незакрытым: место вернется при сборке мусора
+    weakref.finalize(response, release)
+
+
+LIMITER = HostLimiter()
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Хост отключен автоматом: запрос не отправляется (обрабатывается как ошибка соединения)"""
+
+
+class HostHealth:
+    """Задержки и отказы по хостам: адаптивный таймаут и автомат отключения, состояние - в JSON"""
+
+    def __init__(self, path=HOST_STATE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._hosts = None
+        self._trials = set()
+        self.stats = {'requests': 0, 'retries': 0, 'retries_denied': 0, 'rejected': 0, 'opened': 0}
+        # Бюджет повторов на процесс: пополняется с каждым запросом
+        self._retry_tokens = float(RETRY_RESERVE)
+
+    def _load(self):
+        if self._hosts is None:
+            try:
+                with open(self.path, encoding='utf-8') as f:
+                    self._hosts = json.load(f)
+            except (OSError, ValueError):
+                self._hosts = {}
+        return self._hosts
+
+    def _host(self, host):
+        return self._load().setdefault(host, {'latency': [], 'failures': 0, 'opens': 0, 'open_until': 0})
+
+    def timeout(self, host, default):
+        """Таймаут по p95 задержки хоста; пока данных мало - заданный вызовом"""
+        with self._lock:
+            samples = sorted(self._host(host)['latency'])
+        if len(samples) < MIN_SAMPLES:
+            return default
+        p95 = samples[int(0.95 * (len(samples) - 1))] / 1000
+        return min(default, max(MIN_TIMEOUT, p95 * TIMEOUT_FACTOR))
+
+    def allow(self, host, earn=True):
+        """Бросает CircuitOpenError, если хост отключен; после паузы пропускает один пробный запрос.
+        earn - запрос пополняет общий бюджет повторов (только первые попытки запросов, которым повторы разрешены).
+        Возвращает True для пробного запроса"""
+        now = time.time()
+        with self._lock:
+            h = self._host(host)
+            h['seen'] = now
+            if h['failures'] >= BREAKER_THRESHOLD:
+                if h['open_until'] > now or host in self._trials:
+                    self.stats['rejected'] += 1
+                    raise CircuitOpenError(f'{host}: отключен после {h["failures"]} отказов подряд')
+                self._trials.add(host)
+                trial = True
+            else:
+                trial = False
+            self.stats['requests'] += 1
+            if earn:
+                self._retry_tokens += RETRY_RATIO
+        return trial
+
+    def release(self, host):
+        """Освобождает место пробного запроса, если он кончился не ответом и не сетевой ошибкой
+        (InvalidURL, TooManyRedirects...): иначе хост остался бы отключенным до конца процесса"""
+        with self._lock:
+            self._trials.discard(host)
+
+    def success(self, host, seconds):
+        with self._lock:
+            h = self._host(host)
+            h['latency'] = (h['latency'] + [int(seconds * 1000)])[-LATENCY_SAMPLES:]
+            h['failures'] = 0
+            h['opens'] = 0
+            h['open_until'] = 0
+            self._trials.discard(host)
+
+    def failure(self, host):
+        with self._lock:
+            h = self._host(host)
+            h['failures'] += 1
+            trial = host in self._trials
+            # Только переход в отключенное состояние: первое срабатывание или проваленная пробная попытка.
+            # Запросы, ушедшие до срабатывания и упавшие после, паузу не удлиняют
+            if h['failures'] == BREAKER_THRESHOLD or (trial and h['failures'] > BREAKER_THRESHOLD):
+                # Каждое следующее отключение - пауза вдвое длиннее прошлой
+                h['opens'] += 1
+                h['open_until'] = time.time() + min(BREAKER_COOLDOWN * 2 ** (h['opens'] - 1), BREAKER_MAX)
+                self.stats['opened'] += 1
+            self._trials.discard(host)
+
+    def take_retry(self):
+        """Разрешение на повтор из общего бюджета"""
+        with self._lock:
+            if self._retry_tokens >= 1:
+                self._retry_tokens -= 1
+                self.stats['retries'] += 1
+                return True
+            self.stats['retries_denied'] += 1
+            return False
+
+    def save(self):
+        """Сохраняет состояние атомарно; давно не встречавшиеся хосты забываем"""
+        with self._lock:
+            if self._hosts is None:
+                return
+            now = time.time()
+            self._hosts = {host: h for host, h in self._hosts.items()
+                           if now - h.get('seen', now) < HOST_FORGET_AFTER}
+            data = json.dumps(self._hosts, separators=(',', ':'))
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp, self.path)
+
+    def summary(self):
+        s = self.stats
+        with self._lock:
+            now = time.time()
+            down = sum(1 for h in self._load().values()
+                       if h['failures'] >= BREAKER_THRESHOLD and h['open_until'] > now)
+        print(f"🔌 Хосты: запросов {s['requests']}, повторов {s['retries']} (отказано {s['retries_denied']}), "
+              f"отклонено автоматом {s['rejected']}, отключено сейчас {down}")
+
+
+HOSTS = HostHealth()
+
+
+def _retry_delay(attempt, response):
+    """Пауза перед повтором: Retry-After сервера (в пределах RETRY_CAP) или случайная экспоненциальная"""
+    retry_after = response.headers.get('Retry-After', '') if response is not None else ''
+    if retry_after.isdigit():
+        return min(float(retry_after), RETRY_CAP)
+    return random.uniform(0, min(RETRY_CAP, RETRY_BASE * 2 ** attempt))
+
+
+def http_get(url, timeout=20, headers=None, stream=False, limiter=None, retries=RETRY_MAX):
+    """GET через общую сессию с учетом лимитов и состояния хоста.
+
+    Таймаут подстраивается под задержки хоста (timeout - верхняя граница). Ошибки соединения,
+    таймауты и ответы 429/502/503/504 повторяются до retries раз, пока есть общий бюджет повторов.
+    Отключенный автоматом хост сразу дает CircuitOpenError. При stream=True место в лимите хоста
+    освобождается только при закрытии ответа (with r: ...), так что лимит распространяется и на чтение тела.
+    """
+    limiter = limiter or LIMITER
+    host = host_of(url)
+    attempt = 0
+    while True:
+        # Бюджет повторов пополняют только первые попытки запросов, которым повторы разрешены:
+        # проверки потоков (retries=0) и сами повторы его не раздувают
+        trial = HOSTS.allow(host, earn=attempt == 0 and retries > 0)
+        response = error = None
+        release = limiter.acquire(url)
+        try:
+            response = get_session().get(url, timeout=HOSTS.timeout(host, timeout), headers=headers,
+                                         stream=stream)
+        except requests.exceptions.SSLError:
+            # Сертификат не исправится повтором, но хост считаем отказавшим
+            HOSTS.failure(host)
+            raise
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            HOSTS.failure(host)
+            error = e
+        else:
+            if response.status_code >= 500:
+                HOSTS.failure(host)
+            else:
+                # 429 - хост жив, просто просит подождать
+                HOSTS.success(host, response.elapsed.total_seconds())
+            if response.status_code not in TRANSIENT_STATUS:
+                return response
+        finally:
+            if trial:
+                HOSTS.release(host)
+            if stream and response is not None:
+                _release_on_close(response, release)
+            else:
+                release()
+        if attempt >= retries or not HOSTS.take_retry():
+            if error:
+                raise error
+            return response
+        if response is not None:
+            response.close()
+        time.sleep(_retry_delay(attempt, response))
+        attempt += 1
+
+
+def interleave_by_host(urls):
+    """Индексы URL вперемешку по хостам, чтобы потоки не простаивали на одном хосте"""
+    buckets = OrderedDict()
+    for i, url in enumerate(urls):
+        buckets.setdefault(host_of(url), []).append(i)
+    order = []
+    queues = [list(reversed(b)) for b in buckets.values()]
+    while queues:
+        rest = []
+        for q in queues:
+            order.append(q.pop())
+            if q:
+                rest.append(q)
+        queues = rest
+    return order
+
+
+def fetch_many(urls, fn, max_workers=MAX_IN_FLIGHT, on_done=None):
+    """Выполняет fn(url) параллельно; результаты возвращаются в порядке входного списка"""
+    results = [None] * len(urls)
+    if not urls:
+        return results
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(urls))) as ex:
+        futures = {ex.submit(fn, urls[i]): i for i in interleave_by_host(urls)}
+        for fut in as_completed(futures):
+            i = futures[fut]
+            try:
+                results[i] = fut.result()
+            except Exception as e:
+                print(f"   Ошибка загрузки {urls[i][:50]}: {e}")
+            if on_done:
+                on_done(i, urls[i], results[i])
+    return results
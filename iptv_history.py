@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""История проверок потоков в SQLite и планировщик повторных проверок"""
+import json
+import os
+import random
+import sqlite3
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+HISTORY_DB = os.environ.get('IPTV_HISTORY_DB', '.cache/probe_history.sqlite')
+# Сколько проверок можно сделать за запуск (0 - без ограничения)
+PROBE_BUDGET = int(os.environ.get('IPTV_PROBE_BUDGET', '0'))
+# Стабильный поток проверяем заново не реже чем раз в STALE_AFTER, иначе - выборочно
+STALE_AFTER = 24 * 3600
+STABLE_SAMPLE = 0.15
+# Порог затухающего счетчика смен статуса: одна смена дает 1.0, две подряд - 1.5
+FLAP_THRESHOLD = 1.5
+# --from-store: поток, который ни один источник не отдавал дольше LIVE_MAX_AGE, в выдачу не идет
+LIVE_MAX_AGE = 3 * 24 * 3600
+# Хост, мертвый дольше HOST_DEAD_AFTER, уходит в экспоненциальную паузу
+HOST_DEAD_AFTER = 2 * 24 * 3600
+HOST_BACKOFF_BASE = 6 * 3600
+HOST_BACKOFF_MAX = 30 * 24 * 3600
+
+PRIO_NEW, PRIO_FLAPPING, PRIO_STALE, PRIO_SAMPLE = range(4)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS urls (
+    key TEXT PRIMARY KEY,
+    host TEXT NOT NULL,
+    record TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    last_probe REAL,
+    last_status TEXT,
+    last_latency INTEGER,
+    last_error TEXT,
+    streak INTEGER NOT NULL DEFAULT 0,
+    flap_score REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS probes (
+    key TEXT NOT NULL,
+    ts REAL NOT NULL,
+    status TEXT NOT NULL,
+    latency INTEGER,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS probes_key_ts ON probes(key, ts);
+CREATE TABLE IF NOT EXISTS hosts (
+    host TEXT PRIMARY KEY,
+    dead_since REAL,
+    failures INTEGER NOT NULL DEFAULT 0,
+    backoff_until REAL NOT NULL DEFAULT 0
+);
+'''
+
+
+def url_key(url):
+    """Ключ URL для истории: схема и хост в нижнем регистре, без фрагмента"""
+    parts = urlsplit(url.strip())
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or '/', parts.query, ''))
+
+
+def _record_json(c):
+    record = {k: (list(v) if k == 'opts' else v) for k, v in c.items() if k not in ('probe', 'alternates')}
+    return json.dumps(record, ensure_ascii=False)
+
+
+def _record_from_json(text):
+    c = json.loads(text)
+    c['opts'] = tuple(c.get('opts', ()))
+    return c
+
+
+class ProbeHistory:
+    """Хранилище результатов проверок, ключ - нормализованный URL"""
+
+    def __init__(self, path=HISTORY_DB):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def remember(self, channels, now=None):
+        """Запоминает свежие записи каналов (для выдачи плейлистов прямо из хранилища)"""
+        now = now or time.time()
+        self.db.executemany(
+            'INSERT INTO urls (key, host, record, first_seen, last_seen) VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET record = excluded.record, last_seen = excluded.last_seen',
+            [(url_key(c['url']), urlsplit(c['url']).netloc.lower(), _record_json(c), now, now) for c in channels])
+        self.db.commit()
+
+    def plan(self, channels, budget=PROBE_BUDGET, now=None):
+        """Делит каналы на (проверить сейчас, взять прошлый результат)"""
+        now = now or time.time()
+        state = {row[0]: row[1:] for row in self.db.execute(
+            'SELECT key, last_probe, last_status, last_latency, last_error, streak, flap_score FROM urls')}
+        backoff = {row[0] for row in self.db.execute(
+            'SELECT host FROM hosts WHERE backoff_until > ?', (now,))}
+
+        queue = []
+        carried = []
+        for i, c in enumerate(channels):
+            last_probe, status, latency, error, streak, flap = state.get(url_key(c['url']), (None,) * 6)
+            if urlsplit(c['url']).netloc.lower() in backoff:
+                c['probe'] = {'status': 'dead', 'latency': 0, 'error': 'host_backoff', 'cached': True}
+                carried.append(c)
+                continue
+            if last_probe is None:
+                prio = PRIO_NEW
+            elif flap >= FLAP_THRESHOLD:
+                prio = PRIO_FLAPPING
+            elif now - last_probe > STALE_AFTER:
+                prio = PRIO_STALE
+            elif random.random() < STABLE_SAMPLE:
+                prio = PRIO_SAMPLE
+            else:
+                prio = None
+            if prio is None:
+                c['probe'] = {'status': status, 'latency': latency or 0, 'error': error or '', 'cached': True}
+                carried.append(c)
+            else:
+                queue.append((prio, -(flap or 0), last_probe or 0, i, c))
+
+        queue.sort(key=lambda q: q[:4])
+        if budget and len(queue) > budget:
+            for *_, c in queue[budget:]:
+                key = url_key(c['url'])
+                if key in state and state[key][1]:
+                    _, status, latency, error, _, _ = state[key]
+                    c['probe'] = {'status': status, 'latency': latency or 0, 'error': error or '', 'cached': True}
+                else:
+                    c['probe'] = {'status': 'skipped', 'latency': 0, 'error': 'budget', 'cached': True}
+                carried.append(c)
+            queue = queue[:budget]
+        return [q[-1] for q in queue], carried
+
+    def record(self, channels, now=None):
+        """Сохраняет результаты проверок и обновляет счетчики стабильности и паузы хостов"""
+        now = now or time.time()
+        host_alive = {}
+        for c in channels:
+            res = c.get('probe')
+            if not res or res.get('cached') or res['status'] == 'skipped':
+                continue
+            key = url_key(c['url'])
+            host = urlsplit(c['url']).netloc.lower()
+            host_alive[host] = host_alive.get(host, False) or res['status'] == 'live'
+            self.db.execute('INSERT INTO probes (key, ts, status, latency, error) VALUES (?, ?, ?, ?, ?)',
+                            (key, now, res['status'], res['latency'], res['error']))
+            row = self.db.execute('SELECT last_status, streak, flap_score FROM urls WHERE key = ?', (key,)).fetchone()
+            prev, streak, flap = row if row else (None, 0, 0.0)
+            changed = prev is not None and prev != res['status']
+            # Затухающий счетчик смен статуса: два переключения подряд = "мигающий" поток
+            flap = flap * 0.5 + (1.0 if changed else 0.0)
+            streak = 1 if changed or prev is None else streak + 1
+            self.db.execute(
+                'UPDATE urls SET last_probe = ?, last_status = ?, last_latency = ?, last_error = ?, '
+                'streak = ?, flap_score = ? WHERE key = ?',
+                (now, res['status'], res['latency'], res['error'], streak, flap, key))
+
+        for host, alive in host_alive.items():
+            if alive:
+                self.db.execute('DELETE FROM hosts WHERE host = ?', (host,))
+                continue
+            row = self.db.execute('SELECT dead_since, failures FROM hosts WHERE host = ?', (host,)).fetchone()
+            dead_since, failures = row if row else (now, 0)
+            backoff_until = 0
+            if now - dead_since >= HOST_DEAD_AFTER:
+                failures += 1
+                backoff_until = now + min(HOST_BACKOFF_BASE * 2 ** failures, HOST_BACKOFF_MAX)
+            self.db.execute(
+                'INSERT OR REPLACE INTO hosts (host, dead_since, failures, backoff_until) VALUES (?, ?, ?, ?)',
+                (host, dead_since, failures, backoff_until))
+        self.db.commit()
+
+    def live_records(self, max_age=LIVE_MAX_AGE, now=None):
+        """Каналы, живые по последней проверке и встречавшиеся в источниках не раньше max_age секунд назад,
+        в порядке первого появления"""
+        since = (now or time.time()) - max_age
+        rows = self.db.execute(
+            "SELECT record, last_latency FROM urls WHERE last_status = 'live' AND last_seen >= ? "
+            "ORDER BY first_seen, rowid", (since,))
+        channels = []
+        for record, latency in rows:
+            c = _record_from_json(record)
+            c['probe'] = {'status': 'live', 'latency': latency or 0, 'error': '', 'cached': True}
+            channels.append(c)
+        return channels
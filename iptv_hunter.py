@@ -1,14 +1,29 @@
 #!/usr/bin/env python3
-import requests
+import argparse
 import json
 import os
 import sys
-import re
 import time
 from datetime import datetime
-from bs4 import BeautifulSoup
-
-print("🚀 Starting IPTV Hunter Pro...")
+from iptv_fetch import fetch_many, HOSTS
+from iptv_cache import HTTP_CACHE
+from iptv_m3u import format_entry
+from iptv_parallel import iter_response
+from iptv_classify import classify, FLAGS
+from iptv_probe import probe_channels
+from iptv_history import ProbeHistory, PROBE_BUDGET
+from iptv_dedup import dedup_ids, dedup_channels, materialize, rank_alternates, iter_streams
+from iptv_store import ChannelStore
+from iptv_epg import build_epg_index
+from iptv_logos import rewrite_logos
+from iptv_metrics import METRICS, profiled
+from iptv_search import SearchIndexBuilder
+from iptv_outputs import OutputSet, PRUNE_MAX_COUNTRIES
+from iptv_export import Exporter, parse_formats, EXPORT_FORMATS
+from iptv_variants import inspect_variants, VARIANT_BUDGET
+from iptv_discovery import SourceDiscovery, DISCOVERY_TOP_N
+from iptv_shard import parse_shard_spec, shard_of, shard_path, write_shard, merge_shards, SHARD_DIR, MERGE_RSS_MB
+from iptv_spill import OutOfCoreDedup, SpilledChannels, MAX_RSS_MB
 
 # Fallback sources (надежные репозитории)
 FALLBACK_URLS = [
@@ -36,27 +51,11 @@ EPG_URLS = {
     'INT': 'https://epgshare01.online/epgshare01/epg_ripper_ALL.xml.gz'
 }
 
-def search_github():
-    """Поиск свежих источников через DuckDuckGo"""
+def search_github(discovery):
+    """Поиск свежих источников: несколько поисковиков и запросов параллельно, с кэшем выдачи"""
     print("🔍 Ищу свежие плейлисты...")
-    urls = []
     try:
-        query = "site:raw.githubusercontent.com iptv m3u"
-        url = f"https://html.duckduckgo.com/html/?q={query.replace(' ', '+')}"
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
-        
-        r = requests.get(url, headers=headers, timeout=25)
-        soup = BeautifulSoup(r.text, 'html.parser')
-        
-        for link in soup.select('a.result__a'):
-            href = link.get('href', '')
-            if 'raw.githubusercontent.com' in href and '.m3u' in href:
-                clean = href.split('?')[0]
-                if clean not in urls:
-                    urls.append(clean)
-        
-        print(f"   Найдено {len(urls)} новых источников")
-        return urls[:15]  # Берем первые 15 чтобы не перегружать
+        return discovery.search()
     except Exception as e:
         print(f"   Ошибка поиска: {e}")
         return []
@@ -64,200 +63,471 @@ def search_github():
 def check_source_alive(url):
     """Быстрая проверка - работает ли источник (первые 3 канала)"""
     try:
-        r = requests.get(url, timeout=15, headers={'User-Agent': 'VLC/3.0'})
+        r = HTTP_CACHE.get(url, timeout=15, headers={'User-Agent': 'VLC/3.0'})
         if r.status_code == 200 and '#EXTM3U' in r.text:
             # Считаем количество http ссылок
             http_count = len([line for line in r.text.split('\n') if line.strip().startswith('http')])
             if http_count > 0:
                 return True
-    except:
-        pass
+    except Exception as e:
+        print(f"   Источник недоступен: {url[:50]}: {e}")
     return False
 
-def parse_m3u(url):
-    """Парсит плейлист с сохранением групп и метаданных"""
+def load_source(url, spill=None):
+    """Каналы одного источника в компактном хранилище (с метриками источника);
+    со spill записи сразу уходят на диск, а возвращается их число"""
+    store = ChannelStore()
+    count = 0
+    start = time.perf_counter()
     try:
-        r = requests.get(url, timeout=20, headers={'User-Agent': 'Mozilla/5.0'})
-        content = r.text
-        
-        if '#EXTM3U' not in content:
-            return []
-        
-        channels = []
-        lines = content.split('\n')
-        current = {}
-        
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-                
-            if line.startswith('#EXTINF:'):
-                # Имя канала
-                name = line.split(',')[-1] if ',' in line else 'Unknown Channel'
-                
-                # Группа (категория)
-                group_match = re.search(r'group-title="([^"]*)"', line)
-                group = group_match.group(1) if group_match else 'General'
-                
-                # Логотип
-                logo_match = re.search(r'tvg-logo="([^"]*)"', line)
-                logo = logo_match.group(1) if logo_match else ''
-                
-                # ID для EPG
-                id_match = re.search(r'tvg-id="([^"]*)"', line)
-                tvg_id = id_match.group(1) if id_match else ''
-                
-                # Страна (определение по тегам или названию)
-                country = 'INT'  # International по умолчанию
-                low = line.lower()
-                
-                if any(x in low for x in ['tvg-country="ru"', 'russia', ' рус ', 'россия']): country = 'RU'
-                elif any(x in low for x in ['tvg-country="us"', 'usa', 'america']): country = 'US'
-                elif any(x in low for x in ['tvg-country="uk"', 'united kingdom', 'british']): country = 'UK'
-                elif any(x in low for x in ['tvg-country="de"', 'germany', 'deutschland']): country = 'DE'
-                elif any(x in low for x in ['tvg-country="fr"', 'france', 'française']): country = 'FR'
-                elif any(x in low for x in ['tvg-country="it"', 'italy', 'italia']): country = 'IT'
-                elif any(x in low for x in ['tvg-country="es"', 'spain', 'españa']): country = 'ES'
-                elif any(x in low for x in ['tvg-country="ua"', 'ukraine', 'украина']): country = 'UA'
-                elif any(x in low for x in ['tvg-country="pl"', 'poland', 'polska']): country = 'PL'
-                
-                # Если в атрибутах не нашли, пробуем по названию
-                if country == 'INT':
-                    name_low = name.lower()
-                    if any(x in name_low for x in [' ru', 'russia', 'russian']): country = 'RU'
-                    elif any(x in name_low for x in [' us', 'usa', 'american']): country = 'US'
-                    elif any(x in name_low for x in [' uk', 'british', 'england']): country = 'UK'
-                    elif any(x in name_low for x in [' fr', 'france', 'french']): country = 'FR'
-                
-                current = {
-                    'name': name,
-                    'group': group,
-                    'logo': logo,
-                    'tvg_id': tvg_id,
-                    'country': country,
-                    'url': ''  # Заполним позже
-                }
-                
-            elif line.startswith('http') and current:
-                current['url'] = line
-                if line.startswith(('http://', 'https://')):
-                    channels.append(current.copy())
-                current = {}
-        
-        return channels
-        
+        r = HTTP_CACHE.get(url, timeout=20, headers={'User-Agent': 'Mozilla/5.0'})
+        http_seconds = round(time.perf_counter() - start, 3)
+        if r.status_code == 200:
+            records = iter_response(r, classify=classify)
+            if spill:
+                count = spill.spill_source(url, records)
+            else:
+                store.extend(records, source=url)
+                count = len(store)
+        METRICS.source(url, status=r.status_code, http_seconds=http_seconds, from_cache=r.from_cache,
+                       bytes=os.path.getsize(r.path) if r.path else len(r.content),
+                       channels=count, seconds=round(time.perf_counter() - start, 3))
     except Exception as e:
+        METRICS.source(url, status=0, error=type(e).__name__, channels=count,
+                       seconds=round(time.perf_counter() - start, 3))
         print(f"   Ошибка парсинга: {e}")
-        return []
+    return count if spill else store
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='IPTV Hunter Pro')
+    parser.add_argument('--probe', action='store_true', default=os.environ.get('IPTV_PROBE') == '1',
+                        help='проверить каждый поток и записать только живые (IPTV_PROBE=1)')
+    parser.add_argument('--probe-budget', type=int, default=PROBE_BUDGET,
+                        help='максимум проверок за запуск, остальные берутся из истории (0 - без ограничения)')
+    parser.add_argument('--variants', action='store_true', default=os.environ.get('IPTV_VARIANTS') == '1',
+                        help='разобрать HLS-манифесты: разрешение и битрейт в EXTINF, лучшие потоки первыми '
+                             '(IPTV_VARIANTS=1)')
+    parser.add_argument('--variant-budget', type=int, default=VARIANT_BUDGET,
+                        help='максимум запросов манифестов за запуск, остальные берутся из кэша (0 - без ограничения)')
+    parser.add_argument('--epg', action='store_true', default=os.environ.get('IPTV_EPG') == '1',
+                        help='скачать гиды EPG, проиндексировать и заполнить tvg-id по названиям (IPTV_EPG=1)')
+    parser.add_argument('--logos', action='store_true', default=os.environ.get('IPTV_LOGOS') == '1',
+                        help='вынести inline-логотипы в site/logos и заменить короткими URL (IPTV_LOGOS=1)')
+    parser.add_argument('--fetch-logos', action='store_true',
+                        help='то же для внешних логотипов: скачать и сохранить на сайте')
+    parser.add_argument('--from-store', action='store_true',
+                        help='не искать и не проверять, а собрать плейлисты из истории проверок')
+    parser.add_argument('--sources', type=int, default=DISCOVERY_TOP_N,
+                        help='сколько источников загружать (лучшие по истории отдачи каналов)')
+    parser.add_argument('--max-rss', type=int, default=MAX_RSS_MB, metavar='MB',
+                        help='удалять дубликаты и группировать вне памяти с потолком RSS (IPTV_MAX_RSS_MB)')
+    parser.add_argument('--shard', metavar='I/N',
+                        help='обработать только свою долю источников (номер с нуля / всего) и записать шард')
+    parser.add_argument('--shard-dir', default=SHARD_DIR, help='каталог для файлов шардов')
+    parser.add_argument('--merge', nargs='+', metavar='SHARD',
+                        help='собрать плейлисты, метаданные и сайт из файлов шардов')
+    parser.add_argument('--export', default=EXPORT_FORMATS, metavar='FORMATS',
+                        help='форматы экспорта через запятую: m3u, m3u.gz, jsonl, sqlite (IPTV_EXPORT, по умолчанию m3u)')
+    parser.add_argument('--prune', action='store_true',
+                        help='удалить опубликованные файлы, которых нет в этом запуске (не больше '
+                             f'{PRUNE_MAX_COUNTRIES} стран за раз, IPTV_PRUNE_MAX); иначе они остаются с пометкой stale')
+    parser.add_argument('--report', default=os.environ.get('IPTV_REPORT', '.cache/run_report.json'),
+                        help='JSON-отчет о запуске: время стадий и статистика источников (IPTV_REPORT)')
+    parser.add_argument('--prom', default=os.environ.get('IPTV_PROM'),
+                        help='дополнительно записать метрики в формате Prometheus (IPTV_PROM)')
+    parser.add_argument('--profile', default=os.environ.get('IPTV_PROFILE'),
+                        help='снять профиль cProfile всего запуска в указанный файл (IPTV_PROFILE)')
+    args = parser.parse_args(argv)
+    try:
+        args.export = parse_formats(args.export)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.max_rss and (args.probe or args.variants or args.logos or args.fetch_logos or args.from_store
+                         or args.shard):
+        parser.error('--max-rss работает только для обычного сбора и --merge без --probe, --variants, --logos, '
+                     '--from-store и --shard')
+    if args.merge and args.probe:
+        parser.error('--probe выполняется в шардах (--shard ... --probe), при --merge проверка не повторяется')
+    if args.variants and args.shard:
+        parser.error('--variants выполняется при сборке (--merge), а не в шарде')
+    return args
+
+def collect_channels(discovery, top_n=DISCOVERY_TOP_N, shard=None, max_rss_mb=0):
+    """Поиск источников, загрузка и удаление дубликатов; shard=(номер, всего) - только своя доля источников,
+    max_rss_mb - удаление дубликатов вне памяти с потолком RSS"""
     # 1. Ищем свежие источники
-    search_urls = search_github()
+    with METRICS.stage('search'):
+        search_urls = search_github(discovery)
     
-    # 2. Добавляем fallback если мало найдено
-    if len(search_urls) < 3:
-        print("⚠️  Мало источников в поиске, добавляю надежные репозитории...")
-        urls = list(set(FALLBACK_URLS + search_urls))
-    else:
-        urls = search_urls + FALLBACK_URLS[:3]  # Свежие + 3 надежных
+    # 2. Кандидаты: найденные, надежные репозитории и источники из прошлых запусков;
+    # загружаем top_n лучших по истории отдачи каналов (и несколько новых)
+    candidates = FALLBACK_URLS[:3] + search_urls + FALLBACK_URLS[3:] + list(discovery.sources)
+    if shard:
+        candidates = [url for url in candidates if shard_of(url, shard[1]) == shard[0]]
+    urls = discovery.rank(candidates, top_n=top_n, pinned=FALLBACK_URLS)
     
-    print(f"\n📡 Обработка {len(urls)} источников...")
+    print(f"\n📡 Обработка {len(urls)} источников из {len(set(candidates))} кандидатов...")
     
-    # 3. Парсим все источники
-    all_channels = []
-    for i, url in enumerate(urls, 1):
-        print(f"   [{i}/{len(urls)}] {url[:50]}...")
-        ch = parse_m3u(url)
-        if ch:
-            print(f"      +{len(ch)} каналов")
-            all_channels.extend(ch)
-        time.sleep(0.3)  # Небольшая пауза
+    # 3. Парсим все источники параллельно (порядок результатов совпадает с порядком urls)
+    def report(i, url, n):
+        print(f"   [{i + 1}/{len(urls)}] {url[:50]}... +{n or 0} каналов")
+
+    if max_rss_mb:
+        # Записи источников пишутся на диск прямо при разборе, не собираясь в памяти
+        spill = OutOfCoreDedup(max_rss_mb)
+        with METRICS.stage('fetch'):
+            counts = fetch_many(urls, lambda url: load_source(url, spill), on_done=report)
+        if not any(counts):
+            print("❌ Каналы не найдены!")
+            sys.exit(1)
+        return spill_dedup_stage(spill, urls)
+
+    store = ChannelStore()
+    with METRICS.stage('fetch'):
+        for batch in fetch_many(urls, load_source, on_done=lambda i, url, ch: report(i, url, len(ch or []))):
+            if batch:
+                store.merge(batch)
     
-    if not all_channels:
+    if not len(store):
+        if shard:
+            # Пустой шард - не ошибка: у соседних шардов источники могли оказаться удачнее
+            return [], None
         print("❌ Каналы не найдены!")
         sys.exit(1)
     
-    print(f"\n📊 Найдено: {len(all_channels)} каналов (до проверки дубликатов)")
+    return dedup_stage(store, urls)
+
+def dedup_stage(store, sources, probes=None):
+    """Удаляет дубликаты и считает вклад источников; probes - {id записи: результат проверки}"""
+    bytes_per_channel = store.nbytes() // len(store)
+    print(f"\n📊 Найдено: {len(store)} каналов (до проверки дубликатов), "
+          f"в памяти ~{bytes_per_channel} байт на канал")
     
-    # 4. Убираем дубликаты по URL
-    seen_urls = set()
-    unique_channels = []
-    for c in all_channels:
-        url = c['url']
-        if url not in seen_urls:
-            seen_urls.add(url)
-            unique_channels.append(c)
+    # 4. Убираем дубликаты по id: один поток под разными URL и один канал под разными названиями
+    with METRICS.stage('dedup'):
+        entries, dropped = dedup_ids(store)
+    alternates = sum(len(ids) - 1 for ids in entries)
     
-    print(f"🔄 Уникальных каналов: {len(unique_channels)}")
+    # Вклад источников: сколько их каналов осталось основными после удаления дубликатов
+    unique_by_source = {}
+    for ids in entries:
+        src = store.source(ids[0])
+        unique_by_source[src] = unique_by_source.get(src, 0) + 1
+    for url in sources:
+        METRICS.source(url, unique=unique_by_source.get(url, 0))
+    METRICS.count('channels_parsed', len(store))
+    METRICS.count('bytes_per_channel', bytes_per_channel)
     
-    # 5. Группировка по странам
+    print(f"🔄 Уникальных каналов: {len(entries)} (альтернативных потоков: {alternates}, повторов: {dropped})")
+    with METRICS.stage('dedup'):
+        channels = materialize(store, entries)
+        if probes:
+            # Потоки записи идут в том же порядке, что и ids
+            for ids, c in zip(entries, channels):
+                for i, stream in zip(ids, iter_streams([c])):
+                    if i in probes:
+                        stream['probe'] = probes[i]
+        unique_channels = rank_alternates(channels)
+    return unique_channels, bytes_per_channel
+
+def spill_dedup_stage(spill, sources, order=None, live_only=False):
+    """То же, что dedup_stage, для записей на диске: результат совпадает, память ограничена потолком.
+    order - ключи записей в spill по порядку (по умолчанию sources), live_only - только живые потоки"""
+    with METRICS.stage('dedup'):
+        channels, unique_by_source = spill.dedup(sources if order is None else order, live_only)
+    for url in sources:
+        METRICS.source(url, unique=unique_by_source.get(url, 0))
+    s = spill.stats
+    METRICS.count('channels_parsed', s['records'])
+    METRICS.count('peak_rss_bytes', s['peak_rss'])
+    print(f"🔄 Уникальных каналов: {s['entries']} (альтернативных потоков: {s['alternates']}, повторов: {s['dropped']})")
+    spill.summary()
+    return channels, None
+
+def count_live_sources(channels):
+    """Сколько живых основных потоков дал каждый источник (для рейтинга источников)"""
+    live_by_source = {}
+    for c in channels:
+        if (c.get('probe') or {}).get('status') == 'live':
+            live_by_source[c['source']] = live_by_source.get(c['source'], 0) + 1
+    for url in [url for url, m in METRICS.sources.items() if 'unique' in m]:
+        METRICS.source(url, live=live_by_source.get(url, 0))
+
+def probe_stage(channels, budget, live_only=True):
+    """Проверяет новые, мигающие и устаревшие потоки; остальным берет статус из истории"""
+    streams = list(iter_streams(channels))
+    history = ProbeHistory()
+    history.remember(streams)
+    to_probe, carried = history.plan(streams, budget=budget)
+    print(f"🗓️  К проверке: {len(to_probe)}, статус из истории: {len(carried)}")
+    probe_channels(to_probe)
+    history.record(to_probe)
+    history.close()
+    return rank_alternates(channels, live_only=live_only)
+
+def group_by_country(channels):
+    """{страна: [каналы]} в порядке появления"""
+    if isinstance(channels, SpilledChannels):
+        # Вне памяти каналы уже сгруппированы при слиянии
+        return channels.by_country
     by_country = {}
-    for c in unique_channels:
+    for c in channels:
         co = c.get('country', 'INT')
         by_country.setdefault(co, []).append(c)
+    return by_country
+
+def write_playlists(by_country, epg=None, search=None, outputs=None, formats=('m3u',)):
+    """Один проход по каналам: плейлисты playlists/iptv_<страна>.m3u и остальные форматы экспорта,
+    поисковый индекс и дельты стран; неизмененные файлы не переписываются"""
+    outputs = outputs or OutputSet(manifest=None, delta_dir=None)
+    exporter = Exporter(outputs, formats)
+    
+    try:
+        for country, channels in by_country.items():
+            fname = f'playlists/iptv_{country.lower()}.m3u'
+            epg_url = EPG_URLS.get(country, EPG_URLS['INT'])
+            groups = set()
+            feed = outputs.feed(country)
+            
+            # Заголовок с EPG
+            exporter.begin(country, f'#EXTM3U url-tvg="{epg_url}" x-tvg-url="{epg_url}"\n')
+            
+            # Один проход по каналам (вне памяти они читаются с диска): EPG, поиск, дельта, запись
+            for c in channels:
+                if epg:
+                    # tvg-id должны совпадать с гидом, указанным в заголовке этого плейлиста
+                    epg.apply(iter_streams([c]), epg_url)
+                if search:
+                    search.add(country, c)
+                groups.add(c['group'])
+                # Альтернативные потоки идут сразу за основным
+                entry = ''.join(format_entry(stream) for stream in iter_streams([c]))
+                if feed:
+                    feed.add(c, entry)
+                exporter.add(country, c, entry)
+            exporter.end(country)
+            
+            delta = feed.write(outputs, fname) if feed else None
+            status = '' if fname in outputs.changed else ' (без изменений)'
+            if delta:
+                status += f" (+{delta['added']} ~{delta['changed']} -{delta['removed']})"
+            print(f"💾 {fname}: {len(channels)} каналов (групп: {len(groups)}){status}")
+        exporter.close()
+    except BaseException:
+        # Черновики удаляются, опубликованные файлы остаются прежними
+        exporter.abort()
+        raise
+    
+    if len(exporter.formats) > 1:
+        print(f"📤 Экспорт: {', '.join(exporter.formats)}")
+
+def main(argv=None):
+    args = parse_args(argv)
+    with profiled(args.profile):
+        run(args)
+
+def gather_channels(args):
+    """Уникальные каналы запуска: из истории проверок, из шардов или поиском и загрузкой источников"""
+    if args.from_store:
+        history = ProbeHistory()
+        unique_channels = rank_alternates(dedup_channels(history.live_records())[0])
+        bytes_per_channel = None
+        history.close()
+        print(f"🗄️  Из истории проверок: {len(unique_channels)} живых каналов")
+    elif args.merge:
+        # Шарды сливаются потоком через удаление дубликатов вне памяти: память не растет с числом шардов
+        spill = OutOfCoreDedup(args.max_rss or MERGE_RSS_MB)
+        with METRICS.stage('merge'):
+            keys, sources, counters, records, probed = merge_shards(args.merge, spill)
+        for url, m in sources.items():
+            METRICS.source(url, **{k: v for k, v in m.items() if k not in ('unique', 'live')})
+        if not records:
+            print("❌ Каналы не найдены!")
+            sys.exit(1)
+        unique_channels, bytes_per_channel = spill_dedup_stage(spill, sources, order=keys, live_only=probed)
+        METRICS.count('channels_parsed', counters.get('channels_parsed', records))
+        if probed:
+            count_live_sources(unique_channels)
+        if args.variants or args.logos or args.fetch_logos:
+            # Эти стадии меняют каналы на месте - им нужен список в памяти
+            unique_channels = list(unique_channels)
+    else:
+        discovery = SourceDiscovery()
+        shard = parse_shard_spec(args.shard) if args.shard else None
+        unique_channels, bytes_per_channel = collect_channels(discovery, args.sources, shard, args.max_rss)
+        # 4.1 Проверка потоков (по желанию): в плейлисты попадут только живые.
+        # Шард сохраняет и мертвые: при слиянии лучший поток выбирается среди всех шардов
+        if args.probe:
+            with METRICS.stage('probe'):
+                unique_channels = probe_stage(unique_channels, args.probe_budget, live_only=not shard)
+            count_live_sources(unique_channels)
+        # Отдача источников в этом запуске - основа рейтинга для следующего
+        discovery.record(METRICS.sources)
+        discovery.save()
+    # 4.2 Качество потоков по HLS-манифестам: порядок альтернатив и разрешение в EXTINF
+    if args.variants and unique_channels:
+        with METRICS.stage('variants'):
+            unique_channels = inspect_variants(unique_channels, budget=args.variant_budget)
+    return unique_channels, bytes_per_channel
+
+def run(args):
+    print("🚀 Starting IPTV Hunter Pro...")
+    
+    unique_channels, _ = gather_channels(args)
+    if args.shard:
+        shard = parse_shard_spec(args.shard)
+        with METRICS.stage('shard'):
+            parsed = METRICS.counters.get('channels_parsed', 0)
+            write_shard(shard_path(*shard, root=args.shard_dir), *shard, iter_streams(unique_channels),
+                        sources=METRICS.sources, counters={'channels_parsed': parsed}, probed=args.probe)
+        write_report(args)
+        return
+    
+    if not unique_channels:
+        print("❌ Живые каналы не найдены!")
+        sys.exit(1)
+    
+    if args.logos or args.fetch_logos:
+        with METRICS.stage('logos'):
+            rewrite_logos(unique_channels, fetch_remote=args.fetch_logos)
+    
+    # 5. Группировка по странам
+    with METRICS.stage('group'):
+        by_country = group_by_country(unique_channels)
     
     print(f"🌍 Стран: {len(by_country)} ({', '.join(sorted(by_country.keys()))})")
     
     # 6. Создание папок и сохранение M3U
-    os.makedirs('playlists', exist_ok=True)
+    epg = None
+    if args.epg:
+        with METRICS.stage('epg'):
+            epg = build_epg_index(EPG_URLS.values())
+    outputs = OutputSet()
+    with METRICS.stage('write'):
+        # Вне памяти строки поискового индекса тоже копятся на диске
+        search = SearchIndexBuilder(spill=bool(args.max_rss or args.merge))
+        write_playlists(by_country, epg, search, outputs, args.export)
+        search.write()
+        outputs.track(search.root)
     
-    for country, channels in by_country.items():
-        fname = f'playlists/iptv_{country.lower()}.m3u'
-        epg_url = EPG_URLS.get(country, EPG_URLS['INT'])
-        
-        with open(fname, 'w', encoding='utf-8') as f:
-            # Заголовок с EPG
-            f.write(f'#EXTM3U url-tvg="{epg_url}" x-tvg-url="{epg_url}"\n')
-            
-            for c in channels:
-                # Строка EXTINF с метаданными
-                extinf = f'#EXTINF:-1'
-                
-                if c['tvg_id']:
-                    extinf += f' tvg-id="{c["tvg_id"]}"'
-                
-                extinf += f' tvg-name="{c["name"]}"'
-                
-                if c['logo']:
-                    extinf += f' tvg-logo="{c["logo"]}"'
-                
-                extinf += f' group-title="{c["group"]}"'
-                extinf += f',{c["name"]}\n'
-                
-                f.write(extinf)
-                f.write(f'{c["url"]}\n')
-        
-        print(f"💾 {fname}: {len(channels)} каналов (групп: {len(set(ch['group'] for ch in channels))})")
+    if epg:
+        s = epg.stats
+        print(f"📅 EPG: совпало {s['matched']}, заполнено {s['filled']}, исправлено {s['corrected']}, "
+              f"без гида {s['missing']}")
+        epg.close()
     
     # 7. Создание HTML сайта
-    create_website(unique_channels, by_country)
+    with METRICS.stage('site'):
+        create_website(unique_channels, by_country, outputs)
     
-    # 8. Метаданные
+    # 8. Метаданные (память на канал есть только у хранилища в памяти - она идет в отчет о запуске)
+    METRICS.count('channels_total', len(unique_channels))
     meta = {
         'total': len(unique_channels),
         'countries': {k: len(v) for k, v in by_country.items()},
-        'groups': list(set(c['group'] for c in unique_channels)),
+        # Порядок обхода каналов в памяти и вне памяти разный - список групп не должен от него зависеть
+        'groups': sorted({c['group'] for c in unique_channels}),
+        'stages': METRICS.stage_summary(),
         'time': datetime.now().isoformat()
     }
     
-    with open('metadata.json', 'w', encoding='utf-8') as f:
-        json.dump(meta, f, indent=2, ensure_ascii=False)
+    # Время и длительности стадий меняются каждый запуск - изменением файла их не считаем
+    volatile = ('time', 'stages')
+    outputs.write_text('metadata.json', json.dumps(meta, indent=2, ensure_ascii=False),
+                       stable=json.dumps({k: v for k, v in meta.items() if k not in volatile}, ensure_ascii=False))
+    outputs.write_manifest(prune=args.prune)
+    outputs.summary()
+    for key, value in outputs.stats.items():
+        METRICS.count(f'outputs_{key}', value)
     
+    write_report(args)
+
     print(f"\n✅ Готово! {meta['total']} каналов по странам")
 
-def create_website(channels, by_country):
+def write_report(args):
+    """Сохраняет HTTP-кэш и состояние хостов, пишет отчет о запуске"""
+    HTTP_CACHE.save()
+    HTTP_CACHE.summary()
+    for key, value in HTTP_CACHE.stats.items():
+        METRICS.count(f'http_cache_{key}', value)
+    HOSTS.save()
+    HOSTS.summary()
+    for key, value in HOSTS.stats.items():
+        METRICS.count(f'http_{key}', value)
+    METRICS.write(args.report, args.prom)
+
+SEARCH_SCRIPT = """<script>
+(function () {
+    // Поиск по индексу search/: префиксный файл -> ссылки [страна, строка] -> шард страны
+    var input = document.getElementById('search');
+    var out = document.getElementById('results');
+    var gz = 'DecompressionStream' in window;
+    var cache = {};
+    var seq = 0;
+
+    function load(path) {
+        if (!cache[path]) {
+            cache[path] = fetch('search/' + path + (gz ? '.json.gz' : '.json')).then(function (r) {
+                if (!r.ok) return null;
+                return gz ? new Response(r.body.pipeThrough(new DecompressionStream('gzip'))).json() : r.json();
+            }).catch(function () { return null; });
+        }
+        return cache[path];
+    }
+    function tokens(s) {
+        var m = s.normalize('NFKC').toLowerCase().replace(/ё/g, 'е').match(/[\\p{L}\\p{N}_]+/gu) || [];
+        return m.filter(function (t) { return Array.from(t).length >= 2; });
+    }
+    function prefixFile(t) {
+        return Array.from(new TextEncoder().encode(Array.from(t).slice(0, 2).join('')))
+            .map(function (b) { return b.toString(16).padStart(2, '0'); }).join('');
+    }
+    function esc(s) {
+        return String(s).replace(/[&<>"']/g, function (ch) { return '&#' + ch.charCodeAt(0) + ';'; });
+    }
+
+    async function search(q) {
+        var my = ++seq, qt = tokens(q);
+        if (!qt.length) { out.innerHTML = ''; return; }
+        var pref = await load('prefix/' + prefixFile(qt[0])) || {};
+        var refs = [], seen = {};
+        Object.keys(pref).forEach(function (t) {
+            if (!t.startsWith(qt[0])) return;
+            pref[t].forEach(function (r) {
+                var k = r[0] + ':' + r[1];
+                if (!seen[k]) { seen[k] = 1; refs.push(r); }
+            });
+        });
+        var shards = {};
+        await Promise.all(Array.from(new Set(refs.map(function (r) { return r[0]; }))).map(function (cc) {
+            return load('country/' + cc.toLowerCase()).then(function (d) { shards[cc] = d; });
+        }));
+        if (my !== seq) return;
+        var html = [];
+        for (var i = 0; i < refs.length && html.length < 100; i++) {
+            var shard = shards[refs[i][0]];
+            if (!shard) continue;
+            var row = shard.rows[refs[i][1]], nt = tokens(row[0]);
+            if (!qt.every(function (w) { return nt.some(function (t) { return t.startsWith(w); }); })) continue;
+            var logo = shard.logos[row[2]];
+            html.push('<li>' + (logo ? '<img src="' + esc(logo) + '" alt="" loading="lazy">' : '') +
+                '<span class="name">' + esc(row[0]) + '</span><span class="meta">' + esc(refs[i][0]) +
+                ' · ' + esc(shard.groups[row[1]]) + '</span><a href="' + esc(row[3]) + '">▶</a></li>');
+        }
+        out.innerHTML = html.length ? html.join('') : '<li class="empty">Ничего не найдено</li>';
+    }
+
+    input.addEventListener('input', function () { search(input.value); });
+})();
+</script>"""
+
+def create_website(channels, by_country, outputs=None):
     """Создает красивый сайт с iframe"""
+    outputs = outputs or OutputSet(manifest=None, delta_dir=None)
     total = len(channels)
     now = datetime.now().strftime("%d.%m.%Y %H:%M")
     countries = len(by_country)
     
-    flags = {
-        'RU': '🇷🇺', 'US': '🇺🇸', 'UK': '🇬🇧', 'DE': '🇩🇪', 
-        'FR': '🇫🇷', 'IT': '🇮🇹', 'ES': '🇪🇸', 'UA': '🇺🇦', 
-        'PL': '🇵🇱', 'INT': '🌍'
-    }
-    
     # index.html - главная с окошком
     html = f'''<!DOCTYPE html>
 <html lang="ru">
@@ -401,8 +671,8 @@ def create_website(channels, by_country):
 </body>
 </html>'''
     
-    with open('index.html', 'w', encoding='utf-8') as f:
-        f.write(html)
+    # Время обновления само по себе не повод переписывать страницу
+    outputs.write_text('index.html', html, stable=html.replace(now, ''))
     
     # full.html - полная версия
     full = f'''<!DOCTYPE html>
@@ -497,6 +767,29 @@ def create_website(channels, by_country):
         .info li {{ margin-bottom: 12px; color: #cbd5e1; }}
         .info strong {{ color: #fbbf24; }}
         
+        .search-box {{ margin: 10px 0 30px 0; }}
+        .search-box input {{
+            width: 100%;
+            padding: 14px 20px;
+            border-radius: 25px;
+            border: 1px solid #334155;
+            background: #1e293b;
+            color: #e2e8f0;
+            font-size: 16px;
+        }}
+        #results {{ list-style: none; margin-top: 15px; }}
+        #results li {{
+            display: flex;
+            align-items: center;
+            gap: 12px;
+            padding: 10px 15px;
+            border-bottom: 1px solid #334155;
+        }}
+        #results img {{ width: 28px; height: 28px; object-fit: contain; }}
+        #results .name {{ flex: 1; }}
+        #results .meta {{ color: #94a3b8; font-size: 13px; }}
+        #results a {{ color: #64ffda; text-decoration: none; }}
+        
         .footer {{
             text-align: center;
             margin-top: 40px;
@@ -513,11 +806,16 @@ def create_website(channels, by_country):
         <h1>📺 Полный каталог IPTV</h1>
         <p class="subtitle">Все каналы отсортированы по странам с поддержкой EPG</p>
         
+        <div class="search-box">
+            <input id="search" type="search" placeholder="🔎 Поиск канала по названию..." autocomplete="off">
+            <ul id="results"></ul>
+        </div>
+        
         <div class="grid">'''
     
     for country in sorted(by_country.keys()):
         count = len(by_country[country])
-        flag = flags.get(country, '🌐')
+        flag = FLAGS.get(country, '🌐')
         has_epg = country in EPG_URLS
         epg_class = "epg-badge" if has_epg else "epg-badge disabled"
         epg_text = "📅 EPG доступно" if has_epg else "EPG недоступно"
@@ -574,11 +872,11 @@ def create_website(channels, by_country):
             <p>Обновлено: {now} UTC | Создано автоматически</p>
         </div>
     </div>
+    {SEARCH_SCRIPT}
 </body>
 </html>'''
     
-    with open('full.html', 'w', encoding='utf-8') as f:
-        f.write(full)
+    outputs.write_text('full.html', full, stable=full.replace(now, ''))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""Логотипы: inline data: и внешние картинки сохраняются по хэшу на сайт и заменяются короткими URL"""
+import base64
+import hashlib
+import os
+import tempfile
+from urllib.parse import unquote_to_bytes
+
+from iptv_dedup import iter_streams
+from iptv_fetch import fetch_many, http_get
+
+LOGO_DIR = os.environ.get('IPTV_LOGO_DIR', 'site/logos')
+LOGO_BASE_URL = os.environ.get('IPTV_LOGO_BASE', 'https://IPTVRU2026.github.io/IPTVMIR/site/logos')
+LOGO_MAX_BYTES = 512 * 1024
+
+# Сигнатуры форматов -> расширение файла
+MAGIC = [
+    (b'\x89PNG', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF8', 'gif'),
+    (b'RIFF', 'webp'),
+    (b'<svg', 'svg'),
+    (b'<?xml', 'svg'),
+]
+MIME_EXT = {'image/svg+xml': 'svg', 'image/png': 'png', 'image/jpeg': 'jpg', 'image/gif': 'gif',
+            'image/webp': 'webp'}
+
+
+def sniff_ext(data):
+    head = data[:16].lstrip()
+    for magic, ext in MAGIC:
+        if head.startswith(magic):
+            return ext
+    return None
+
+
+def decode_data_uri(uri):
+    """(байты, расширение) из data:image/...; None если формат не картинка"""
+    meta, _, payload = uri[5:].partition(',')
+    mime, *params = meta.split(';')
+    ext = MIME_EXT.get(mime.strip().lower())
+    if not ext:
+        return None
+    try:
+        data = base64.b64decode(payload) if 'base64' in params else unquote_to_bytes(payload)
+    except ValueError:
+        return None
+    return data, ext
+
+
+class LogoStore:
+    """Логотипы, сохраненные по sha256 содержимого: одинаковые картинки - один файл"""
+
+    def __init__(self, root=LOGO_DIR, base_url=LOGO_BASE_URL):
+        self.root = root
+        self.base_url = base_url.rstrip('/')
+        self.stats = {'inline': 0, 'remote': 0, 'failed': 0, 'bytes_saved': 0}
+
+    def put(self, data, ext):
+        """Сохраняет картинку и возвращает ее короткий URL"""
+        name = f'{hashlib.sha256(data).hexdigest()[:20]}.{ext}'
+        path = os.path.join(self.root, name)
+        if not os.path.exists(path):
+            os.makedirs(self.root, exist_ok=True)
+            # Свое имя черновика у каждого потока: одинаковые картинки пишутся параллельно
+            fd, tmp = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            # mkstemp создает файл 0600, а картинки публикуются на сайте
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, path)
+        return f'{self.base_url}/{name}'
+
+    def from_data_uri(self, uri):
+        decoded = decode_data_uri(uri)
+        if not decoded:
+            return None
+        self.stats['inline'] += 1
+        return self.put(*decoded)
+
+    def from_remote(self, url):
+        """Скачивает картинку потоком, не дальше LOGO_MAX_BYTES. Мимо HTTP_CACHE: логотипы сохраняются
+        в LOGO_DIR по содержимому и не должны вытеснять из общего кэша тела плейлистов"""
+        try:
+            with http_get(url, timeout=15, headers={'User-Agent': 'Mozilla/5.0'}, stream=True) as r:
+                if r.status_code != 200 or int(r.headers.get('Content-Length') or 0) > LOGO_MAX_BYTES:
+                    return None
+                data = bytearray()
+                for chunk in r.iter_content(64 * 1024):
+                    data += chunk
+                    if len(data) > LOGO_MAX_BYTES:
+                        return None
+        except Exception:
+            return None
+        data = bytes(data)
+        ext = sniff_ext(data)
+        if not ext:
+            return None
+        return self.put(data, ext)
+
+
+def rewrite_logos(channels, fetch_remote=False, store=None):
+    """Заменяет логотипы каналов короткими URL; каждое уникальное значение обрабатывается один раз"""
+    store = store or LogoStore()
+    streams = list(iter_streams(channels))
+    distinct = list(dict.fromkeys(c['logo'] for c in streams if c['logo']))
+
+    mapping = {}
+    for logo in distinct:
+        if logo.startswith('data:'):
+            url = store.from_data_uri(logo)
+            if url:
+                mapping[logo] = url
+            else:
+                store.stats['failed'] += 1
+
+    if fetch_remote:
+        remote = [logo for logo in distinct if logo.startswith(('http://', 'https://'))
+                  and not logo.startswith(store.base_url)]
+        for logo, url in zip(remote, fetch_many(remote, store.from_remote)):
+            if url:
+                mapping[logo] = url
+                store.stats['remote'] += 1
+            else:
+                store.stats['failed'] += 1
+
+    for c in streams:
+        new = mapping.get(c['logo'])
+        if new:
+            store.stats['bytes_saved'] += len(c['logo']) - len(new)
+            c['logo'] = new
+
+    s = store.stats
+    print(f"🖼️  Логотипы: {len(distinct)} уникальных, inline -> файлы: {s['inline']}, "
+          f"скачано: {s['remote']}, без замены: {s['failed']}, плейлисты легче на {s['bytes_saved'] // 1024} КБ")
+    return store
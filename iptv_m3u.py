@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""Потоковый однопроходный разбор M3U: построчно, без загрузки файла целиком"""
+import re
+import sys
+
+# key="value" за один проход; inline SVG-логотипы содержат кавычки внутри значения
+ATTR_RE = re.compile(r'([A-Za-z0-9_-]+)="(data:image/svg\+xml,<svg.*?</svg>|[^"]*)"')
+# Строки-опции между #EXTINF и URL, которые плеерам нужно сохранить
+OPTION_PREFIXES = ('#EXTVLCOPT:', '#KODIPROP:')
+NO_OPTS = ()
+# Код канала без пробелов (хотя бы с одной латинской буквой) и запятая вплотную перед названием
+LEADING_ID_RE = re.compile(r'[A-Za-z0-9_.-]*[A-Za-z][A-Za-z0-9_.-]*,(?=\S)')
+# Атрибуты #EXT-X-STREAM-INF мастер-плейлиста HLS: KEY=значение или KEY="значение"
+STREAM_ATTR_RE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+
+def parse_extinf(line):
+    """Атрибуты и название из строки #EXTINF.
+
+    Идентификатор без атрибута перед названием ('...",ATXN3,AVA Family') отбрасывается,
+    запятая внутри самого названия сохраняется:
+
+    >>> parse_extinf('#EXTINF:-1 group-title="Иран",ATXN3,AVA Family')[1]
+    'AVA Family'
+    >>> parse_extinf('#EXTINF:-1 group-title="SMOTRIM",36,6 HD')[1]
+    '36,6 HD'
+    >>> parse_extinf('#EXTINF:-1,Channel, HD')[1]
+    'Channel, HD'
+    >>> parse_extinf('#EXTINF:-1 tvg-id="x"')[1]
+    'Unknown Channel'
+    """
+    attrs = {}
+    end = 0
+    for m in ATTR_RE.finditer(line):
+        attrs[m.group(1).lower()] = m.group(2)
+        end = m.end()
+    tail = line[end:]
+    if ',' not in tail:
+        return attrs, 'Unknown Channel'
+    name = tail.split(',', 1)[1].strip()
+    m = LEADING_ID_RE.match(name)
+    if m and m.end() < len(name):
+        name = name[m.end():]
+    return attrs, name
+
+
+def iter_m3u(lines, classify=None):
+    """Генератор записей каналов из итератора строк плейлиста"""
+    header = False
+    current = None
+    opts = []
+    group_hint = ''
+
+    for line in lines:
+        line = line.strip().lstrip('\ufeff')
+        if not line:
+            continue
+
+        if line.startswith('#EXTM3U'):
+            header = True
+        elif line.startswith('#EXTINF:'):
+            if not header:
+                return
+            attrs, name = parse_extinf(line)
+            current = (line, attrs, name)
+            opts = []
+            group_hint = ''
+        elif current is None:
+            continue
+        elif line.startswith(OPTION_PREFIXES):
+            opts.append(line)
+        elif line.startswith('#EXTGRP:'):
+            group_hint = line[8:].strip()
+        elif line.startswith('#'):
+            continue
+        else:
+            extinf, attrs, name = current
+            current = None
+            if not line.startswith(('http://', 'https://')):
+                continue
+            yield {
+                'name': name,
+                'group': attrs.get('group-title') or group_hint or 'General',
+                # Один и тот же логотип (часто inline SVG) повторяется тысячи раз - храним одну копию
+                'logo': sys.intern(attrs.get('tvg-logo', '')),
+                'tvg_id': attrs.get('tvg-id', ''),
+                'country': classify(extinf, attrs, name, line) if classify else 'INT',
+                'url': line,
+                'opts': tuple(opts) if opts else NO_OPTS,
+            }
+
+
+def format_entry(c):
+    """Запись канала в формате M3U: #EXTINF, опции, URL (с переводами строк)"""
+    attrs = ['#EXTINF:-1']
+    if c['tvg_id']:
+        attrs.append(f'tvg-id="{c["tvg_id"]}"')
+    attrs.append(f'tvg-name="{c["name"]}"')
+    if c['logo']:
+        attrs.append(f'tvg-logo="{c["logo"]}"')
+    attrs.append(f'group-title="{c["group"]}"')
+    # Лучший вариант HLS (стадия --variants); bitrate - в бит/с, как BANDWIDTH в манифесте
+    variant = c.get('variant') or {}
+    if variant.get('resolution'):
+        attrs.append(f'resolution="{variant["resolution"]}"')
+    if variant.get('bandwidth'):
+        attrs.append(f'bitrate="{variant["bandwidth"]}"')
+    return '\n'.join((' '.join(attrs) + ',' + c['name'], *c['opts'], c['url'])) + '\n'
+
+
+def parse_master(text):
+    """[(bandwidth, width, height), ...] из #EXT-X-STREAM-INF, лучший первым; [] - медиаплейлист"""
+    variants = []
+    for line in text.splitlines():
+        if not line.startswith('#EXT-X-STREAM-INF:'):
+            continue
+        attrs = {k: v.strip('"') for k, v in STREAM_ATTR_RE.findall(line[18:])}
+        try:
+            bandwidth = int(attrs.get('BANDWIDTH') or attrs.get('AVERAGE-BANDWIDTH') or 0)
+        except ValueError:
+            bandwidth = 0
+        width, _, height = attrs.get('RESOLUTION', '').lower().partition('x')
+        variants.append((bandwidth, int(width) if width.isdigit() else 0, int(height) if height.isdigit() else 0))
+    variants.sort(key=lambda v: (v[2], v[0]), reverse=True)
+    return variants
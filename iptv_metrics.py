@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""Метрики запуска: время стадий (wall/CPU), статистика по источникам, JSON-отчет и Prometheus"""
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class RunMetrics:
+    """Накопитель метрик одного запуска"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Чистый накопитель для нового запуска в том же процессе (обновление сервера плейлистов)"""
+        with self._lock:
+            self.stages = {}
+            self.sources = {}
+            self.counters = {}
+            self.started = time.time()
+
+    @contextmanager
+    def stage(self, name):
+        """Замер стадии; повторные входы в одну стадию суммируются"""
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            with self._lock:
+                s = self.stages.setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'calls': 0})
+                s['wall'] += wall
+                s['cpu'] += cpu
+                s['calls'] += 1
+
+    def source(self, url, **fields):
+        with self._lock:
+            self.sources.setdefault(url, {}).update(fields)
+
+    def count(self, name, value):
+        with self._lock:
+            self.counters[name] = value
+
+    def stage_summary(self):
+        """{стадия: секунды} для metadata.json"""
+        return {name: round(s['wall'], 3) for name, s in self.stages.items()}
+
+    def report(self):
+        return {
+            'started': datetime.fromtimestamp(self.started).isoformat(),
+            'duration': round(time.time() - self.started, 3),
+            'stages': {name: {'wall': round(s['wall'], 4), 'cpu': round(s['cpu'], 4), 'calls': s['calls']}
+                       for name, s in self.stages.items()},
+            'sources': self.sources,
+            'counters': self.counters,
+        }
+
+    def prometheus(self):
+        """Текстовый формат Prometheus (для node_exporter textfile collector)"""
+        lines = []
+
+        def metric(name, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} gauge')
+            for labels, value in samples:
+                label_text = ','.join(f'{k}="{_label(v)}"' for k, v in labels.items())
+                lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+
+        metric('iptv_stage_wall_seconds', 'Wall time per stage',
+               [({'stage': n}, round(s['wall'], 4)) for n, s in self.stages.items()])
+        metric('iptv_stage_cpu_seconds', 'CPU time per stage (whole process)',
+               [({'stage': n}, round(s['cpu'], 4)) for n, s in self.stages.items()])
+        for field, name, help_text in (
+                ('bytes', 'iptv_source_bytes', 'Response body size per source'),
+                ('http_seconds', 'iptv_source_http_seconds', 'HTTP latency per source'),
+                ('status', 'iptv_source_http_status', 'HTTP status per source (0 - network error)'),
+                ('channels', 'iptv_source_channels', 'Parsed channels per source'),
+                ('unique', 'iptv_source_unique_channels', 'Channels per source kept after dedup')):
+            metric(name, help_text, [({'source': url}, s[field]) for url, s in self.sources.items() if field in s])
+        for name, value in self.counters.items():
+            metric(f'iptv_{name}', name.replace('_', ' '), [({}, value)])
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path, prom_path=None):
+        """Пишет JSON-отчет и (по желанию) файл Prometheus; оба атомарно"""
+        for target, text in ((path, json.dumps(self.report(), indent=2, ensure_ascii=False)),
+                             (prom_path, self.prometheus() if prom_path else None)):
+            if not target:
+                continue
+            os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+            tmp = target + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp, target)
+
+
+METRICS = RunMetrics()
+
+
+@contextmanager
+def profiled(path):
+    """cProfile на время блока (включается только по флагу - накладные расходы заметны).
+
+    Профилировщик cProfile видит только свой поток, поэтому каждый поток, запущенный внутри блока
+    (загрузка, проверка, варианты), получает свой, а в конце профили складываются в один.
+    Процессы пула разбора (iptv_parallel) в профиль не попадают.
+    """
+    if not path:
+        yield
+        return
+    profilers = [cProfile.Profile()]
+    lock = threading.Lock()
+
+    def start_thread(*_):
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+: cProfile на sys.monitoring уже охватывает все потоки
+            sys.setprofile(None)
+            return
+        with lock:
+            profilers.append(profiler)
+
+    threading.setprofile(start_thread)
+    profilers[0].enable()
+    try:
+        yield
+    finally:
+        profilers[0].disable()
+        threading.setprofile(None)
+        with lock:
+            stats = pstats.Stats(profilers[0])
+            for profiler in profilers[1:]:
+                stats.add(profiler)
+        stats.dump_stats(path)
+        print(f"🔬 Профиль сохранен: {path} (потоков: {len(profilers)})")
+        stats.sort_stats('cumulative').print_stats(20)
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""Инкрементальная запись результатов: файл переписывается, только если изменилось его содержимое.
+
+manifest.json - sha256 и размер каждого опубликованного файла: зеркало и клиенты качают только то,
+чей хэш поменялся. deltas/iptv_<страна>.json - изменения плейлиста страны от версии base к версии sha256
+(добавленные, измененные, удаленные каналы): клиенту с плейлистом base достаточно дельты.
+Файлы, которые запуск не записал, остаются опубликованными с пометкой stale (удаляет их только --prune).
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+from contextlib import contextmanager
+from datetime import datetime
+
+from iptv_dedup import identity_keys
+
+MANIFEST = os.environ.get('IPTV_MANIFEST', 'manifest.json')
+DELTA_DIR = os.environ.get('IPTV_DELTA_DIR', 'deltas')
+MANIFEST_FORMAT = 1
+# --prune не удаляет файлы, если за один запуск пропало больше стран
+PRUNE_MAX_COUNTRIES = int(os.environ.get('IPTV_PRUNE_MAX', '3'))
+STALE_COUNTRY_RE = re.compile(r'iptv_([a-z0-9]+)\.')
+CHUNK = 64 * 1024
+# Сколько символов копить перед записью в файл
+BUFFER_CHARS = 256 * 1024
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def channel_key(c):
+    """Ключ канала в дельте: первый ключ личности (tvg-id или название в стране), иначе URL"""
+    keys = identity_keys(c['tvg_id'], c['name'], c['country'])
+    return ':'.join(keys[0]) if keys else c['url']
+
+
+class _HashingFile:
+    """Байты во временный файл; sha256 и размер считаются по ходу записи"""
+
+    def __init__(self, path):
+        self._f = open(path, 'wb')
+        self.sha = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.sha.update(data)
+        self.size += len(data)
+        return self._f.write(data)
+
+    def flush(self):
+        self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+
+class PendingFile:
+    """Текст копится в буфере и пишется кусками во временный файл (по желанию - через gzip);
+    close() публикует файл через OutputSet, abort() удаляет черновик"""
+
+    def __init__(self, outputs, path, gzip_level=None):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.outputs = outputs
+        self.path = path
+        self.tmp = path + '.tmp'
+        self._raw = _HashingFile(self.tmp)
+        # mtime=0: одинаковое содержимое - одинаковые байты архива
+        self._out = gzip.GzipFile(fileobj=self._raw, mode='wb', compresslevel=gzip_level, mtime=0) \
+            if gzip_level else self._raw
+        self._buffer = []
+        self._buffered = 0
+
+    def write(self, text):
+        self._buffer.append(text)
+        self._buffered += len(text)
+        if self._buffered >= BUFFER_CHARS:
+            self._flush()
+
+    def _flush(self):
+        if self._buffer:
+            self._out.write(''.join(self._buffer).encode('utf-8'))
+            self._buffer = []
+            self._buffered = 0
+
+    def close(self):
+        """Публикует файл; True, если содержимое изменилось"""
+        self._flush()
+        if self._out is not self._raw:
+            self._out.close()
+        self._raw.close()
+        return self.outputs.commit(self.tmp, self.path, self._raw.sha.hexdigest(), self._raw.size)
+
+    def abort(self):
+        if self._out is not self._raw:
+            self._out.close()
+        self._raw.close()
+        os.remove(self.tmp)
+
+
+class OutputSet:
+    """Файлы одного запуска: сравнение с прошлым манифестом, атомарная запись только измененных"""
+
+    def __init__(self, manifest=MANIFEST, delta_dir=DELTA_DIR):
+        self.manifest = manifest
+        self.delta_dir = delta_dir
+        self.previous = {}
+        if manifest:
+            try:
+                with open(manifest, encoding='utf-8') as f:
+                    self.previous = json.load(f).get('files', {})
+            except (OSError, ValueError):
+                pass
+        self.files = {}
+        self.changed = set()
+        self.stats = {'written': 0, 'unchanged': 0, 'stale': 0, 'marked': 0, 'removed': 0}
+
+    def _unchanged(self, path, content):
+        """Прошлая версия с тем же содержимым на месте (файл мог быть удален или заменен вручную)"""
+        prev = self.previous.get(path)
+        return bool(prev) and prev.get('content', prev['sha256']) == content and \
+            os.path.exists(path) and os.path.getsize(path) == prev['size']
+
+    def _record(self, path, entry, changed):
+        if entry.get('stale'):
+            # Файл снова есть в запуске - снимаем пометку, манифест придется переписать
+            entry = {k: v for k, v in entry.items() if k != 'stale'}
+            self.stats['marked'] += 1
+        self.files[path] = entry
+        if changed:
+            self.changed.add(path)
+        self.stats['written' if changed else 'unchanged'] += 1
+
+    def keep(self, path):
+        """Файл не пишется в этом запуске, но остается опубликованным"""
+        entry = self.previous.get(path)
+        if entry is None or not os.path.exists(path):
+            entry = {'sha256': file_sha256(path), 'size': os.path.getsize(path)}
+        self._record(path, entry, False)
+
+    def create(self, path, gzip_level=None):
+        """Файл для потоковой записи; публикуется при close(), если байты отличаются от прошлой версии"""
+        return PendingFile(self, path, gzip_level)
+
+    @contextmanager
+    def open(self, path):
+        f = self.create(path)
+        try:
+            yield f
+        except BaseException:
+            f.abort()
+            raise
+        f.close()
+
+    def commit(self, tmp, path, digest=None, size=None):
+        """Готовый временный файл заменяет опубликованный или удаляется, если содержимое то же"""
+        if digest is None:
+            digest, size = file_sha256(tmp), os.path.getsize(tmp)
+        if self._unchanged(path, digest):
+            os.remove(tmp)
+            self._record(path, self.previous[path], False)
+            return False
+        os.replace(tmp, path)
+        self._record(path, {'sha256': digest, 'size': size}, True)
+        return True
+
+    def write_text(self, path, text, stable=None):
+        """Запись целиком; stable - текст без изменчивых частей (времени), по нему судим об изменениях"""
+        data = text.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        content = hashlib.sha256(stable.encode('utf-8')).hexdigest() if stable is not None else digest
+        if self._unchanged(path, content):
+            self._record(path, self.previous[path], False)
+            return False
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        entry = {'sha256': digest, 'size': len(data)}
+        if stable is not None:
+            entry['content'] = content
+        self._record(path, entry, True)
+        return True
+
+    def track(self, root):
+        """Добавляет в манифест файлы, записанные в обход OutputSet (например, поисковый индекс)"""
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for name in sorted(filenames):
+                path = os.path.join(dirpath, name).replace(os.sep, '/')
+                entry = {'sha256': file_sha256(path), 'size': os.path.getsize(path)}
+                prev = self.previous.get(path)
+                self._record(path, entry, prev is None or prev['sha256'] != entry['sha256'])
+
+    def feed(self, country):
+        return DeltaFeed(country, self.delta_dir) if self.delta_dir else None
+
+    def stale_countries(self, paths):
+        """Страны, чьи плейлисты или дельты есть среди paths"""
+        found = (STALE_COUNTRY_RE.match(os.path.basename(p)) for p in paths)
+        return sorted({m.group(1) for m in found if m})
+
+    def settle_stale(self, prune=False, max_countries=PRUNE_MAX_COUNTRIES):
+        """Файлы прошлого манифеста, не записанные в этом запуске.
+
+        По умолчанию они остаются опубликованными (ссылки подписчиков не ломаются) и помечаются
+        в манифесте как stale. prune=True удаляет их, но не больше max_countries стран за раз:
+        массовое исчезновение - скорее сбой источников, чем настоящие изменения.
+        """
+        stale = [p for p in sorted(set(self.previous) - set(self.files)) if os.path.exists(p)]
+        countries = self.stale_countries(stale)
+        if prune and len(countries) > max_countries:
+            print(f"⚠️  Отказ в очистке: пропали бы {len(countries)} стран ({', '.join(countries)}), "
+                  f"предел {max_countries}")
+            prune = False
+        for path in stale:
+            if prune:
+                os.remove(path)
+                self.changed.add(path)
+                self.stats['removed'] += 1
+                continue
+            entry = self.previous[path]
+            if not entry.get('stale'):
+                entry = dict(entry, stale=True)
+                self.stats['marked'] += 1
+            self.files[path] = entry
+            self.stats['stale'] += 1
+
+    def write_manifest(self, prune=False):
+        """Манифест меняется, только если поменялся набор файлов, хотя бы один хэш или пометка stale"""
+        if not self.manifest:
+            return
+        self.settle_stale(prune)
+        if self.stats['written'] or self.stats['marked'] or set(self.files) != set(self.previous):
+            data = {'format': MANIFEST_FORMAT, 'updated': datetime.now().isoformat(timespec='seconds'),
+                    'files': dict(sorted(self.files.items()))}
+            tmp = self.manifest + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=1, ensure_ascii=False)
+            os.replace(tmp, self.manifest)
+
+    def summary(self):
+        s = self.stats
+        print(f"🧾 Файлы: изменено {s['written']}, без изменений {s['unchanged']}, "
+              f"устаревших {s['stale']}, удалено {s['removed']} ({self.manifest})")
+
+
+class DeltaFeed:
+    """Снимок плейлиста страны {ключ канала: хэш записи} и его отличия от снимка прошлого запуска"""
+
+    def __init__(self, country, root=DELTA_DIR):
+        self.country = country
+        name = f'iptv_{country.lower()}.json'
+        self.feed_path = os.path.join(root, name).replace(os.sep, '/')
+        self.state_path = os.path.join(root, 'state', name).replace(os.sep, '/')
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        self.base = state.get('sha256')
+        self.previous = state.get('channels', {})
+        self.current = {}
+        self.added = []
+        self.changed = []
+        # Без прошлого снимка дельта бесполезна (нужен весь плейлист) - каналы в нее не копируем
+        self.detailed = self.base is not None
+
+    def add(self, c, text):
+        """c - основной канал, text - его записи M3U вместе с альтернативами"""
+        key = base = channel_key(c)
+        n = 1
+        while key in self.current:
+            n += 1
+            key = f'{base}#{n}'
+        digest = hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+        self.current[key] = digest
+        old = self.previous.get(key)
+        if old != digest and self.detailed:
+            (self.added if old is None else self.changed).append(
+                {'key': key, 'name': c['name'], 'group': c['group'], 'url': c['url'], 'm3u': text})
+
+    def write(self, outputs, playlist):
+        """Новая дельта и снимок - только если плейлист страны изменился; иначе остается прошлая дельта"""
+        sha = outputs.files[playlist]['sha256']
+        if sha == self.base and os.path.exists(self.feed_path):
+            outputs.keep(self.feed_path)
+            outputs.keep(self.state_path)
+            return None
+        removed = [k for k in self.previous if k not in self.current]
+        counts = {'added': len(self.added) if self.detailed else len(self.current),
+                  'changed': len(self.changed), 'removed': len(removed), 'total': len(self.current)}
+        outputs.write_text(self.feed_path, json.dumps({
+            'country': self.country,
+            'playlist': playlist,
+            'base': self.base,
+            'sha256': sha,
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'counts': counts,
+            'added': self.added,
+            'changed': self.changed,
+            'removed': removed,
+        }, ensure_ascii=False, separators=(',', ':')))
+        outputs.write_text(self.state_path, json.dumps({'sha256': sha, 'channels': self.current},
+                                                       ensure_ascii=False, separators=(',', ':')))
+        return counts
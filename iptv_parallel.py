@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""Разбор больших плейлистов на нескольких ядрах: куски по границам записей, пачки записей в JSON.
+
+Результат и порядок записей совпадают с iter_m3u: кусок начинается со строки #EXTINF, а состояние
+разбора между записями не переносится. Маленькие тела и одноядерные машины разбираются как раньше.
+"""
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from iptv_m3u import iter_m3u, NO_OPTS
+
+# Сколько процессов разбора (0 или 1 - только последовательный разбор)
+PARSE_WORKERS = int(os.environ.get('IPTV_PARSE_WORKERS', str(os.cpu_count() or 1)))
+# Тела меньше порога разбираются в текущем процессе: запуск пула и пересылка дороже выигрыша
+PARALLEL_MIN_BYTES = int(os.environ.get('IPTV_PARALLEL_MIN_MB', '8')) * 1024 * 1024
+# Размер куска для одного задания (граница сдвигается до ближайшей строки #EXTINF)
+CHUNK_BYTES = int(os.environ.get('IPTV_CHUNK_MB', '4')) * 1024 * 1024
+# Сколько кусков на процесс держать в работе: ограничивает память под готовые пачки
+WINDOW_PER_WORKER = 2
+
+ENTRY_MARK = b'\n#EXTINF:'
+SCAN_BYTES = 64 * 1024
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Общий пул процессов; forkserver - родитель уже многопоточный (fetch_many), fork небезопасен"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            methods = multiprocessing.get_all_start_methods()
+            ctx = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            _pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=ctx)
+    return _pool
+
+
+def _next_entry(f, pos):
+    """Смещение первой строки #EXTINF, которая начинается не раньше pos (None - до конца файла нет)"""
+    keep = len(ENTRY_MARK) - 1
+    # Читаем с байта перед pos: запись может начинаться ровно на pos
+    offset = pos - 1
+    f.seek(offset)
+    buf = b''
+    while True:
+        block = f.read(SCAN_BYTES)
+        if not block:
+            return None
+        buf += block
+        found = buf.find(ENTRY_MARK)
+        if found >= 0:
+            return offset + found + 1
+        tail = buf[-keep:]
+        offset += len(buf) - len(tail)
+        buf = tail
+
+
+def split_chunks(path, chunk_bytes=None):
+    """Диапазоны байт [start, end), каждый (кроме первого) начинается со строки #EXTINF
+
+    chunk_bytes=None - берется CHUNK_BYTES модуля на момент вызова (его можно переопределить после импорта)
+    """
+    chunk_bytes = chunk_bytes or CHUNK_BYTES
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as f:
+        while bounds[-1] + chunk_bytes < size:
+            start = _next_entry(f, bounds[-1] + chunk_bytes)
+            if start is None:
+                break
+            bounds.append(start)
+    bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+
+def _lines(f):
+    return (line.rstrip('\r\n') for line in f)
+
+
+def _has_header(path):
+    """Есть ли #EXTM3U до первой записи - иначе iter_m3u не отдает ничего"""
+    with open(path, encoding='utf-8', errors='replace', newline='') as f:
+        for line in f:
+            line = line.strip().lstrip('\ufeff')
+            if line.startswith('#EXTM3U'):
+                return True
+            if line.startswith('#EXTINF:'):
+                return False
+    return False
+
+
+def _parse_chunk(path, start, end, classify):
+    """Задание процесса: разбор куска файла; пачка записей - одна JSON-строка массивов"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    # Те же правила деления на строки, что при чтении файла целиком (newline='')
+    lines = _lines(io.StringIO(data.decode('utf-8', 'replace'), newline=''))
+    # Кусок после первого начинается с записи: заголовок уже проверен по первому куску
+    if start:
+        lines = itertools.chain(['#EXTM3U'], lines)
+    rows = [[c['name'], c['group'], c['logo'], c['tvg_id'], c['country'], c['url'], c['opts']]
+            for c in iter_m3u(lines, classify=classify)]
+    return json.dumps(rows, ensure_ascii=False, separators=(',', ':'))
+
+
+def _decode_batch(batch):
+    for name, group, logo, tvg_id, country, url, opts in json.loads(batch):
+        yield {
+            'name': name,
+            'group': group,
+            'logo': sys.intern(logo),
+            'tvg_id': tvg_id,
+            'country': country,
+            'url': url,
+            'opts': tuple(opts) if opts else NO_OPTS,
+        }
+
+
+def iter_m3u_file(path, classify=None, workers=None, min_bytes=None):
+    """Записи плейлиста из файла в порядке iter_m3u; большой файл разбирается пулом процессов"""
+    workers = PARSE_WORKERS if workers is None else workers
+    min_bytes = PARALLEL_MIN_BYTES if min_bytes is None else min_bytes
+    chunks = split_chunks(path) if workers > 1 and os.path.getsize(path) >= min_bytes else []
+    if len(chunks) < 2:
+        with open(path, encoding='utf-8', errors='replace', newline='') as f:
+            yield from iter_m3u(_lines(f), classify=classify)
+        return
+    if not _has_header(path):
+        return
+
+    pool = get_pool()
+    pending = deque()
+    queue = iter(chunks)
+    for start, end in itertools.islice(queue, workers * WINDOW_PER_WORKER):
+        pending.append(pool.submit(_parse_chunk, path, start, end, classify))
+    try:
+        while pending:
+            batch = pending.popleft().result()
+            for start, end in itertools.islice(queue, 1):
+                pending.append(pool.submit(_parse_chunk, path, start, end, classify))
+            yield from _decode_batch(batch)
+    finally:
+        # Потребитель бросил генератор (ошибка, прерывание) - не оставляем задания в очереди
+        for future in pending:
+            future.cancel()
+
+
+def iter_response(r, classify=None):
+    """Записи из ответа HTTP_CACHE: тело на диске - через iter_m3u_file, иначе построчно из памяти"""
+    if r.path:
+        return iter_m3u_file(r.path, classify=classify)
+    return iter_m3u(r.iter_lines(), classify=classify)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""Проверка живости потоков: HLS-манифест, один уровень вариантов, Range-запрос первого сегмента"""
+import os
+import time
+from collections import Counter
+from urllib.parse import urljoin
+
+import requests
+
+from iptv_fetch import HostLimiter, CircuitOpenError, http_get, fetch_many
+from iptv_m3u import parse_master
+
+PROBE_WORKERS = int(os.environ.get('IPTV_PROBE_WORKERS', '200'))
+PROBE_PER_HOST = int(os.environ.get('IPTV_PROBE_PER_HOST', '4'))
+PROBE_HOST_DELAY = float(os.environ.get('IPTV_PROBE_HOST_DELAY', '0.05'))
+PROBE_TIMEOUT = float(os.environ.get('IPTV_PROBE_TIMEOUT', '8'))
+# Общий бюджет времени на всю стадию, секунд
+PROBE_DEADLINE = float(os.environ.get('IPTV_PROBE_DEADLINE', '240'))
+MANIFEST_LIMIT = 256 * 1024
+SEGMENT_BYTES = 2048
+HEADERS = {'User-Agent': 'VLC/3.0'}
+
+PROBE_LIMITER = HostLimiter(per_host=PROBE_PER_HOST, delay=PROBE_HOST_DELAY)
+
+
+class ProbeError(Exception):
+    """Ошибка проверки с классом ошибки для статистики"""
+
+    def __init__(self, kind, detail=''):
+        super().__init__(f'{kind}: {detail}' if detail else kind)
+        self.kind = kind
+
+
+def _read_limited(r, limit):
+    """(тело не длиннее limit, мс до первого байта тела от отправки запроса)"""
+    # Ожидание в очереди лимитера хоста - не задержка сервера: считаем от отправки запроса
+    headers_at = time.monotonic()
+    chunks = r.iter_content(8192)
+    buf = bytearray(next(chunks, b''))
+    ttfb = int((r.elapsed.total_seconds() + time.monotonic() - headers_at) * 1000)
+    if len(buf) < limit:
+        for chunk in chunks:
+            buf += chunk
+            if len(buf) >= limit:
+                break
+    return bytes(buf[:limit]), ttfb
+
+
+def _get(url, deadline, limit, headers=None):
+    """GET с таймаутом, урезанным до остатка общего бюджета; возвращает (url, тело, TTFB в мс)"""
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise ProbeError('deadline')
+    try:
+        # Без повторов: проверка измеряет поток как есть, а общий бюджет повторов нужнее загрузке источников
+        r = http_get(url, timeout=min(PROBE_TIMEOUT, remaining), headers={**HEADERS, **(headers or {})},
+                     stream=True, limiter=PROBE_LIMITER, retries=0)
+    except CircuitOpenError:
+        raise ProbeError('host_down')
+    except requests.exceptions.Timeout:
+        raise ProbeError('timeout')
+    except requests.exceptions.SSLError:
+        raise ProbeError('ssl')
+    except requests.exceptions.ConnectionError:
+        raise ProbeError('connection')
+    with r:
+        if r.status_code >= 500:
+            raise ProbeError('http_5xx', str(r.status_code))
+        if r.status_code >= 400:
+            raise ProbeError('http_4xx', str(r.status_code))
+        try:
+            return (r.url, *_read_limited(r, limit))
+        except requests.exceptions.RequestException:
+            raise ProbeError('timeout')
+
+
+def _first_uri(text, base, after_tag=None):
+    """Первый URI в плейлисте (или первый после тега, например #EXT-X-STREAM-INF)"""
+    armed = after_tag is None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if after_tag and line.startswith(after_tag):
+            armed = True
+        elif not line.startswith('#') and armed:
+            return urljoin(base, line)
+    return None
+
+
+def probe_stream(url, deadline, manifest=None):
+    """Проверяет один поток; бросает ProbeError при неудаче.
+    manifest - словарь, куда кладутся TTFB и варианты HLS первого ответа (стадии --variants не нужно
+    скачивать манифест второй раз)"""
+    final_url, body, ttfb = _get(url, deadline, MANIFEST_LIMIT)
+    is_hls = body.lstrip(b'\xef\xbb\xbf \r\n').startswith(b'#EXTM3U')
+    text = body.decode('utf-8', 'replace') if is_hls else ''
+    if manifest is not None:
+        manifest.update(ttfb=ttfb, variants=parse_master(text) if is_hls else None)
+    if not is_hls:
+        # Не HLS (прямой TS/MP4 поток) - уже получили первые байты
+        if not body:
+            raise ProbeError('empty')
+        return
+
+    if '#EXT-X-STREAM-INF' in text:
+        variant = _first_uri(text, final_url, '#EXT-X-STREAM-INF')
+        if not variant:
+            raise ProbeError('bad_manifest', 'no variant')
+        final_url, body, _ = _get(variant, deadline, MANIFEST_LIMIT)
+        text = body.decode('utf-8', 'replace')
+
+    segment = _first_uri(text, final_url)
+    if not segment:
+        raise ProbeError('bad_manifest', 'no segment')
+    _, data, _ = _get(segment, deadline, SEGMENT_BYTES, headers={'Range': f'bytes=0-{SEGMENT_BYTES - 1}'})
+    if not data:
+        raise ProbeError('empty')
+
+
+def probe_channel(url, deadline):
+    """Статус, задержка (мс) и класс ошибки для одного канала; manifest - ответ на первый запрос
+    в формате iptv_variants (TTFB и варианты или ошибка), если его удалось получить"""
+    start = time.monotonic()
+    manifest = {}
+    try:
+        probe_stream(url, deadline, manifest)
+        status, error = 'live', ''
+    except ProbeError as e:
+        status, error = ('skipped' if e.kind == 'deadline' else 'dead'), e.kind
+        if not manifest and e.kind != 'deadline':
+            manifest = {'error': e.kind}
+    except Exception:
+        status, error = 'dead', 'error'
+    result = {'status': status, 'latency': int((time.monotonic() - start) * 1000), 'error': error}
+    if manifest:
+        result['manifest'] = manifest
+    return result
+
+
+def probe_channels(channels, deadline_s=PROBE_DEADLINE, workers=PROBE_WORKERS):
+    """Проверяет все каналы параллельно, пишет результат в c['probe'] и возвращает живые"""
+    deadline = time.monotonic() + deadline_s
+    urls = [c['url'] for c in channels]
+    results = fetch_many(urls, lambda u: probe_channel(u, deadline), max_workers=workers)
+
+    live = []
+    stats = Counter()
+    for c, res in zip(channels, results):
+        res = res or {'status': 'dead', 'latency': 0, 'error': 'error'}
+        c['probe'] = res
+        stats[res['error'] or res['status']] += 1
+        if res['status'] == 'live':
+            live.append(c)
+
+    print(f"🩺 Проверено потоков: {len(channels)}, живых: {len(live)} "
+          f"({', '.join(f'{k}: {v}' for k, v in stats.most_common())})")
+    return live
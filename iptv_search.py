@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""Поисковый индекс для статического сайта: шарды по странам и группам, префиксный индекс, .gz-варианты"""
+import gzip
+import hashlib
+import itertools
+import json
+import os
+import re
+import shutil
+import tempfile
+import unicodedata
+from array import array
+
+from iptv_store import Interner
+
+SEARCH_DIR = os.environ.get('IPTV_SEARCH_DIR', 'search')
+# По первым PREFIX_LEN символам слова сайт выбирает, какой файл префиксного индекса загрузить
+PREFIX_LEN = 2
+TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Слова названия в нижнем регистре (ё -> е), не короче PREFIX_LEN"""
+    text = unicodedata.normalize('NFKC', text).lower().replace('ё', 'е')
+    return [t for t in TOKEN_RE.findall(text) if len(t) >= PREFIX_LEN]
+
+
+def prefix_file(token):
+    """Имя файла префикса: hex, чтобы не зависеть от кириллицы и эмодзи в путях"""
+    return token[:PREFIX_LEN].encode('utf-8').hex()
+
+
+def group_file(group):
+    return hashlib.sha1(group.encode('utf-8')).hexdigest()[:12]
+
+
+def _write_chunks(path, chunks):
+    """Текст кусками в файл и его заранее сжатую копию .gz (mtime=0 - одинаковый результат от запуска к запуску)"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    size = 0
+    with open(path, 'wb') as f, open(path + '.gz', 'wb') as g:
+        with gzip.GzipFile(fileobj=g, mode='wb', compresslevel=9, mtime=0) as gz:
+            for chunk in chunks:
+                raw = chunk.encode('utf-8')
+                f.write(raw)
+                gz.write(raw)
+                size += len(raw)
+    return size
+
+
+def _write_json(path, data):
+    return _write_chunks(path, [json.dumps(data, ensure_ascii=False, separators=(',', ':'))])
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+class _RowsFile:
+    """Строки шарда страны на диске (по строке JSON на канал) - вместо списка в памяти"""
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._file = open(path, 'w', encoding='utf-8')
+
+    def append(self, row):
+        self._file.write(_dumps(row) + '\n')
+        self.count += 1
+
+    def __len__(self):
+        return self.count
+
+    def chunks(self):
+        """'[строка,строка,...]' кусками, без чтения файла целиком"""
+        self._file.close()
+        yield '['
+        with open(self.path, encoding='utf-8') as f:
+            for i, line in enumerate(f):
+                yield (',' if i else '') + line.rstrip('\n')
+        yield ']'
+
+
+class SearchIndexBuilder:
+    """Собирает индекс по мере записи плейлистов; ссылки на каналы - пары [страна, строка].
+    spill=True - строки шардов стран копятся во временных файлах (запуск с --max-rss)"""
+
+    def __init__(self, root=SEARCH_DIR, spill=False):
+        self.root = root
+        self.shards = {}
+        self.groups = {}
+        self.tokens = {}
+        # Ссылка хранится одним числом (номер страны << 32 | строка) в array: в разы меньше пары-списка
+        self.countries = []
+        self.spill_dir = tempfile.mkdtemp(prefix='iptv-search-') if spill else None
+
+    def add(self, country, c):
+        shard = self.shards.get(country)
+        if shard is None:
+            rows = _RowsFile(os.path.join(self.spill_dir, f'{len(self.shards):03d}.jsonl')) if self.spill_dir else []
+            shard = self.shards[country] = {'groups': Interner(), 'logos': Interner(), 'rows': rows,
+                                            'index': len(self.countries)}
+            self.countries.append(country)
+        row = len(shard['rows'])
+        shard['rows'].append([c['name'], shard['groups'].id(c['group']), shard['logos'].id(c['logo']), c['url']])
+        ref = shard['index'] << 32 | row
+        refs = self.groups.get(c['group'])
+        if refs is None:
+            refs = self.groups[c['group']] = array('Q')
+        refs.append(ref)
+        for token in dict.fromkeys(tokenize(c['name'])):
+            refs = self.tokens.get(token)
+            if refs is None:
+                refs = self.tokens[token] = array('Q')
+            refs.append(ref)
+
+    def _refs(self, refs):
+        return [[self.countries[ref >> 32], ref & 0xFFFFFFFF] for ref in refs]
+
+    def write(self):
+        """Пишет индекс заново (старые шарды удаляются)"""
+        shutil.rmtree(self.root, ignore_errors=True)
+        total_bytes = 0
+
+        for country, shard in self.shards.items():
+            head = f'{{"groups":{_dumps(shard["groups"].values)},"logos":{_dumps(shard["logos"].values)},"rows":'
+            rows = shard['rows']
+            body = rows.chunks() if isinstance(rows, _RowsFile) else [_dumps(rows)]
+            total_bytes += _write_chunks(os.path.join(self.root, 'country', f'{country.lower()}.json'),
+                                         itertools.chain([head], body, ['}']))
+
+        for group, refs in self.groups.items():
+            total_bytes += _write_json(os.path.join(self.root, 'group', f'{group_file(group)}.json'),
+                                       {'name': group, 'refs': self._refs(refs)})
+
+        prefixes = {}
+        for token, refs in self.tokens.items():
+            prefixes.setdefault(prefix_file(token), {})[token] = refs
+        for name, tokens in prefixes.items():
+            total_bytes += _write_json(os.path.join(self.root, 'prefix', f'{name}.json'),
+                                       {token: self._refs(refs) for token, refs in tokens.items()})
+
+        total_bytes += _write_json(os.path.join(self.root, 'meta.json'), {
+            'prefix_len': PREFIX_LEN,
+            'total': sum(len(s['rows']) for s in self.shards.values()),
+            'countries': {country: len(s['rows']) for country, s in self.shards.items()},
+            'groups': {group: {'file': group_file(group), 'count': len(refs)} for group, refs in self.groups.items()},
+        })
+        if self.spill_dir:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+        print(f"🔎 Поисковый индекс: {len(self.shards)} стран, {len(self.groups)} групп, "
+              f"{len(prefixes)} префиксов, {total_bytes // 1024} КБ (+ .gz)")
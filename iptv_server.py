@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""Сервер плейлистов: индекс каналов в памяти, M3U/JSON по фильтрам, фоновое обновление источников"""
+import argparse
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+import iptv_hunter
+from iptv_m3u import format_entry
+
+# Интервал фонового обновления, секунд (как у расписания Actions)
+REFRESH_INTERVAL = 6 * 3600
+# Сколько готовых ответов держать на один снимок индекса
+RESPONSE_CACHE_SIZE = 256
+# Ответы меньше этого размера не сжимаем
+GZIP_MIN_BYTES = 1024
+
+
+def _split(value):
+    return tuple(sorted({v.strip().lower() for v in value.split(',') if v.strip()}))
+
+
+def parse_filters(query):
+    """Нормализованные фильтры запроса: одинаковые запросы дают один ключ кэша ответов"""
+    q = {k: v[-1] for k, v in parse_qs(query).items()}
+    return (
+        tuple(c.upper() for c in _split(q.get('country', ''))),
+        _split(q.get('group', '')),
+        q.get('q', '').strip().lower(),
+        q.get('live') == '1',
+        q.get('alternates', '1') != '0',
+    )
+
+
+def accepts_gzip(header):
+    """Разрешает ли Accept-Encoding ответ в gzip: явный gzip или *, и не с q=0"""
+    weights = {}
+    for part in (header or '').split(','):
+        name, *params = [p.strip() for p in part.split(';')]
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name:
+            weights[name.lower()] = q
+    return weights.get('gzip', weights.get('*', 0.0)) > 0
+
+
+class Response:
+    __slots__ = ('body', 'gz', 'etag', 'content_type')
+
+    def __init__(self, body, content_type):
+        self.body = body
+        self.content_type = content_type
+        self.etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+        self.gz = gzip.compress(body, compresslevel=6, mtime=0) if len(body) >= GZIP_MIN_BYTES else None
+
+
+class PlaylistIndex:
+    """Неизменяемый снимок каналов с индексами по стране и группе; заменяется целиком при обновлении"""
+
+    def __init__(self, channels, generation=0):
+        self.channels = channels
+        self.generation = generation
+        self.built = time.time()
+        self.by_country = {}
+        self.by_group = {}
+        self.names = []
+        self.live = []
+        for i, c in enumerate(channels):
+            self.by_country.setdefault(c['country'], []).append(i)
+            self.by_group.setdefault(c['group'].lower(), []).append(i)
+            self.names.append(c['name'].lower())
+            self.live.append((c.get('probe') or {}).get('status') == 'live')
+        # Записи M3U готовим заранее: ответ - это склейка готовых строк
+        self.primary_m3u = [format_entry(c) for c in channels]
+        self.alternates_m3u = [''.join(format_entry(a) for a in c.get('alternates', ())) for c in channels]
+        # То же для JSON: объект канала без закрывающей скобки и хвост с альтернативами
+        self.item_json = [self._item(c, live)[:-1] for c, live in zip(channels, self.live)]
+        self.alternates_json = [',"alternates":' + self._dumps([a['url'] for a in c.get('alternates', ())]) + '}'
+                                for c in channels]
+        self.streams = len(channels) + sum(len(c.get('alternates', ())) for c in channels)
+        self._responses = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _dumps(obj):
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+    def _item(self, c, live):
+        return self._dumps({'name': c['name'], 'country': c['country'], 'group': c['group'], 'logo': c['logo'],
+                            'tvg_id': c['tvg_id'], 'url': c['url'], 'live': live})
+
+    def select(self, countries, groups, q, live_only):
+        """Номера каналов в исходном порядке"""
+        ids = None
+        if countries:
+            ids = sorted(i for cc in countries for i in self.by_country.get(cc, ()))
+        if groups:
+            in_groups = sorted(i for g in groups for i in self.by_group.get(g, ()))
+            ids = in_groups if ids is None else sorted(set(ids).intersection(in_groups))
+        if ids is None:
+            ids = range(len(self.channels))
+        if q:
+            names = self.names
+            ids = [i for i in ids if q in names[i]]
+        if live_only:
+            live = self.live
+            ids = [i for i in ids if live[i]]
+        return ids
+
+    def _render_m3u(self, filters):
+        countries, _, _, _, alternates = filters
+        ids = self.select(*filters[:4])
+        epg_urls = iptv_hunter.EPG_URLS
+        epg_url = epg_urls.get(countries[0], epg_urls['INT']) if len(countries) == 1 else epg_urls['INT']
+        parts = [f'#EXTM3U url-tvg="{epg_url}" x-tvg-url="{epg_url}"\n']
+        for i in ids:
+            parts.append(self.primary_m3u[i])
+            if alternates:
+                parts.append(self.alternates_m3u[i])
+        return Response(''.join(parts).encode('utf-8'), 'audio/x-mpegurl; charset=utf-8')
+
+    def _render_json(self, filters):
+        alternates = filters[4]
+        ids = self.select(*filters[:4])
+        items = [self.item_json[i] + (self.alternates_json[i] if alternates else '}') for i in ids]
+        body = f'{{"generation":{self.generation},"total":{len(items)},"channels":[{",".join(items)}]}}'
+        return Response(body.encode('utf-8'), 'application/json; charset=utf-8')
+
+    def response(self, kind, filters):
+        """Готовый ответ из кэша снимка; при промахе - рендер и вытеснение самого старого"""
+        key = (kind, filters)
+        with self._lock:
+            resp = self._responses.get(key)
+            if resp is not None:
+                self._responses.move_to_end(key)
+                return resp
+        resp = self._render_m3u(filters) if kind == 'm3u' else self._render_json(filters)
+        with self._lock:
+            self._responses[key] = resp
+            while len(self._responses) > RESPONSE_CACHE_SIZE:
+                self._responses.popitem(last=False)
+        return resp
+
+    def warm(self):
+        """Готовит самые частые ответы (весь плейлист и плейлисты стран) до подмены снимка"""
+        for countries in [()] + [(cc,) for cc in self.by_country]:
+            self.response('m3u', (countries, (), '', False, True))
+
+    def health(self):
+        return {'generation': self.generation, 'built': self.built, 'channels': len(self.channels),
+                'streams': self.streams,
+                'countries': {cc: len(ids) for cc, ids in self.by_country.items()}}
+
+
+class PlaylistServer:
+    """Индекс в памяти плюс поток, который пересобирает его по расписанию и подменяет одной ссылкой"""
+
+    def __init__(self, hunter_args, host='0.0.0.0', port=8080, interval=REFRESH_INTERVAL):
+        self.hunter_args = hunter_args
+        self.interval = interval
+        self.index = None
+        self.last_error = None
+        self._stop = threading.Event()
+        handler = type('Handler', (PlaylistHandler,), {'server_state': self})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.refresher = threading.Thread(target=self._refresh_loop, daemon=True)
+
+    def refresh(self):
+        """Собирает новый снимок; при ошибке остается прежний"""
+        start = time.perf_counter()
+        # Метрики каждого обновления - с нуля: иначе рейтинг источников снова учел бы прошлые загрузки
+        iptv_hunter.METRICS.reset()
+        try:
+            channels, _ = iptv_hunter.gather_channels(self.hunter_args)
+            iptv_hunter.write_report(self.hunter_args)
+            generation = self.index.generation + 1 if self.index else 1
+            index = PlaylistIndex(channels, generation)
+            index.warm()
+        except (Exception, SystemExit) as e:
+            # gather_channels завершает процесс, если каналов нет - серверу достаточно старого снимка
+            self.last_error = repr(e)
+            print(f"⚠️  Обновление не удалось: {e!r}")
+            return
+        self.index = index
+        self.last_error = None
+        print(f"🔁 Индекс #{index.generation}: {len(index.channels)} каналов за {time.perf_counter() - start:.1f} с")
+
+    def _refresh_loop(self):
+        self.refresh()
+        while not self._stop.wait(self.interval):
+            self.refresh()
+
+    def serve_forever(self):
+        self.refresher.start()
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self._stop.set()
+            self.httpd.server_close()
+
+
+class PlaylistHandler(BaseHTTPRequestHandler):
+    """GET /playlist.m3u, /channels.json (?country=RU,US&group=News&q=sport&live=1&alternates=0), /health"""
+    server_state = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.do_GET(head=True)
+
+    def do_GET(self, head=False):
+        state = self.server_state
+        # Одно чтение ссылки: весь запрос обслуживается одним снимком, даже если его подменят
+        index = state.index
+        parts = urlsplit(self.path)
+        if parts.path == '/health':
+            status = index.health() if index else {'generation': 0, 'loading': True}
+            status['error'] = state.last_error
+            return self._send(200, Response(json.dumps(status).encode('utf-8'), 'application/json'), head)
+        kind = {'/playlist.m3u': 'm3u', '/channels.json': 'json'}.get(parts.path)
+        if kind is None:
+            return self._send(404, Response(b'not found', 'text/plain'), head)
+        if index is None:
+            return self._send(503, Response(b'index is loading', 'text/plain'), head, {'Retry-After': '30'})
+        resp = index.response(kind, parse_filters(parts.query))
+        if self.headers.get('If-None-Match') == resp.etag:
+            self.send_response(304)
+            self.send_header('ETag', resp.etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self._send(200, resp, head, {'ETag': resp.etag, 'Cache-Control': 'public, max-age=300'})
+
+    def _send(self, status, resp, head=False, headers=None):
+        body = resp.body
+        self.send_response(status)
+        self.send_header('Content-Type', resp.content_type)
+        self.send_header('Vary', 'Accept-Encoding')
+        if resp.gz is not None and accepts_gzip(self.headers.get('Accept-Encoding')):
+            body = resp.gz
+            self.send_header('Content-Encoding', 'gzip')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Сервер плейлистов IPTV Hunter',
+                                     epilog='остальные параметры передаются iptv_hunter.py (--probe, --sources, ...)')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--refresh', type=float, default=REFRESH_INTERVAL,
+                        help='интервал обновления источников, секунд')
+    args, rest = parser.parse_known_args(argv)
+    hunter_args = iptv_hunter.parse_args(rest)
+    if hunter_args.max_rss:
+        # Индекс сервера держит каналы в памяти - режим вне памяти ему не подходит
+        parser.error('--max-rss не поддерживается сервером плейлистов')
+    server = PlaylistServer(hunter_args, args.host, args.port, args.refresh)
+    print(f"📺 Сервер плейлистов: http://{args.host}:{args.port}/playlist.m3u?country=RU")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""Распределенный запуск: шард обрабатывает свою долю источников, merge сводит шарды в общий результат"""
+import gzip
+import hashlib
+import json
+import os
+
+SHARD_DIR = os.environ.get('IPTV_SHARD_DIR', 'shards')
+SHARD_FORMAT = 1
+# Потолок RSS для слияния, если --max-rss не задан: шарды сливаются вне памяти всегда
+MERGE_RSS_MB = int(os.environ.get('IPTV_MERGE_RSS_MB', '256'))
+# Порядок полей в строке-записи шарда
+FIELDS = ('name', 'group', 'logo', 'tvg_id', 'country', 'url', 'opts', 'source', 'probe')
+
+
+def parse_shard_spec(spec):
+    """'2/8' -> (2, 8); номера шардов с нуля"""
+    index, _, count = spec.partition('/')
+    index, count = int(index), int(count)
+    if not 0 <= index < count:
+        raise ValueError(f'номер шарда вне диапазона: {spec}')
+    return index, count
+
+
+def shard_of(url, count):
+    """Шард источника по хэшу URL - одинаковый на всех машинах и при любом порядке кандидатов"""
+    return int.from_bytes(hashlib.sha1(url.encode('utf-8')).digest()[:8], 'big') % count
+
+
+def shard_path(index, count, root=SHARD_DIR):
+    return os.path.join(root, f'shard-{index:03d}-of-{count:03d}.jsonl.gz')
+
+
+def write_shard(path, index, count, streams, sources, counters=None, probed=False):
+    """Пишет заголовок, записи (по массиву на строку) и метрики источников; атомарно"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = path + '.tmp'
+    n = 0
+    # mtime=0: одинаковые шарды дают одинаковые байты
+    with gzip.GzipFile(tmp, 'wb', compresslevel=6, mtime=0) as gz:
+        def line(obj):
+            gz.write(json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n')
+
+        line({'format': SHARD_FORMAT, 'shard': index, 'count': count, 'probed': probed, 'fields': FIELDS})
+        for c in streams:
+            probe = c.get('probe')
+            line([c['name'], c['group'], c['logo'], c['tvg_id'], c['country'], c['url'], list(c['opts']),
+                  c.get('source', ''), [probe['status'], probe['latency'], probe['error']] if probe else None])
+            n += 1
+        line({'sources': sources, 'counters': counters or {}, 'records': n})
+    os.replace(tmp, path)
+    print(f"🧩 Шард {index + 1}/{count}: {n} записей -> {path}")
+    return n
+
+
+def read_shard(path):
+    """(заголовок, генератор записей-словарей, словарь итогов - заполняется по окончании записей)"""
+    f = gzip.open(path, 'rt', encoding='utf-8')
+    header = json.loads(f.readline())
+    if header.get('format') != SHARD_FORMAT:
+        f.close()
+        raise ValueError(f'{path}: неизвестный формат шарда {header.get("format")}')
+    footer = {}
+
+    def records():
+        with f:
+            for raw in f:
+                row = json.loads(raw)
+                if isinstance(row, dict):
+                    footer.update(row)
+                    continue
+                c = dict(zip(FIELDS, row))
+                c['opts'] = tuple(c['opts'])
+                if c['probe']:
+                    c['probe'] = dict(zip(('status', 'latency', 'error'), c['probe']))
+                yield c
+
+    return header, records(), footer
+
+
+def merge_shards(paths, spill):
+    """Потоком переносит записи шардов (по порядку номеров) в spill - OutOfCoreDedup; в памяти их не держим.
+
+    Возвращает (ключи spill в порядке шардов, {url: метрики источника}, {счетчик: сумма}, записей,
+    все ли шарды с проверкой). Результат не зависит от того, в каком порядке и когда шарды были получены.
+    """
+    opened = sorted((read_shard(p) + (p,) for p in paths), key=lambda s: s[0]['shard'])
+    counts = {h['count'] for h, _, _, _ in opened}
+    if len(counts) > 1:
+        raise ValueError(f'шарды из разных разбиений: {sorted(counts)}')
+    missing = set(range(counts.pop())) - {h['shard'] for h, _, _, _ in opened} if opened else set()
+    if missing:
+        print(f"⚠️  Нет шардов: {', '.join(str(i) for i in sorted(missing))} - результат будет неполным")
+
+    sources = {}
+    counters = {}
+    records = 0
+    for header, rows, footer, path in opened:
+        records += spill.spill_records(path, rows)
+        sources.update(footer.get('sources', {}))
+        for name, value in footer.get('counters', {}).items():
+            counters[name] = counters.get(name, 0) + value
+        print(f"   🧩 {path}: {footer.get('records', 0)} записей")
+    keys = [path for _, _, _, path in opened]
+    return keys, sources, counters, records, all(h['probed'] for h, _, _, _ in opened)
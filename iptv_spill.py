@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""Удаление дубликатов и группировка вне памяти: записи на диске, ключи в SQLite, внешняя сортировка.
+
+Результат совпадает с обычным путем (dedup_ids -> materialize -> rank_alternates -> group_by_country),
+но в памяти одновременно держится только буфер записей, ограниченный по RSS.
+"""
+import atexit
+import heapq
+import itertools
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+
+from iptv_dedup import normalize_url, identity_keys, _link_alternates, rank_alternates
+
+# Потолок RSS процесса в МБ (0 - выключено, обычный путь в памяти)
+MAX_RSS_MB = int(os.environ.get('IPTV_MAX_RSS_MB', '0'))
+# Где держать временные файлы (по умолчанию - системный tmp)
+SPILL_DIR = os.environ.get('IPTV_SPILL_DIR') or None
+# Доля свободной памяти под буфер сортируемых записей и под кэш страниц SQLite
+# (кэш SQLite с заголовками страниц и фрагментацией занимает примерно в полтора раза больше заданного)
+BUFFER_SHARE = 0.25
+CACHE_SHARE = 0.15
+# Память на запись в буфере сверх самой строки: кортеж, два числа и место в списке
+# (размер строки берется из sys.getsizeof: кириллица в str занимает по 2 байта на символ)
+RECORD_OVERHEAD = 150
+
+FIELDS = ('name', 'group', 'logo', 'tvg_id', 'country', 'url', 'opts', 'source')
+
+
+def current_rss():
+    """Текущий RSS процесса в байтах (0, если /proc недоступен)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _encode(c):
+    row = [c['name'], c['group'], c['logo'], c['tvg_id'], c['country'], c['url'], list(c['opts']),
+           c.get('source', '')]
+    # Результат проверки (записи шардов) - необязательное последнее поле
+    if c.get('probe'):
+        row.append(c['probe'])
+    return json.dumps(row, ensure_ascii=False, separators=(',', ':'))
+
+
+def _decode(line):
+    row = json.loads(line)
+    c = dict(zip(FIELDS, row))
+    c['opts'] = tuple(c['opts'])
+    if len(row) > len(FIELDS):
+        c['probe'] = row[len(FIELDS)]
+    return c
+
+
+class KeyIndex:
+    """Ключи URL и личности каналов в SQLite: хэш-множество на диске вместо словарей dedup_ids"""
+
+    def __init__(self, path, cache_bytes):
+        self.db = sqlite3.connect(path)
+        self.db.executescript(f'''
+            PRAGMA journal_mode = OFF;
+            PRAGMA synchronous = OFF;
+            PRAGMA cache_size = -{max(cache_bytes // 1024, 2048)};
+            CREATE TABLE urls (key TEXT PRIMARY KEY) WITHOUT ROWID;
+            CREATE TABLE canon (key TEXT PRIMARY KEY, entry INTEGER NOT NULL) WITHOUT ROWID;
+            CREATE TABLE ids (key TEXT PRIMARY KEY, entry INTEGER NOT NULL) WITHOUT ROWID;
+        ''')
+
+    def add_url(self, url):
+        """True, если URL (как есть) встретился впервые"""
+        return self.db.execute('INSERT OR IGNORE INTO urls VALUES (?)', (url,)).rowcount == 1
+
+    def url_entry(self, key):
+        """Запись, которой принадлежит канонический URL, или None"""
+        row = self.db.execute('SELECT entry FROM canon WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def bind_url(self, key, entry):
+        self.db.execute('INSERT OR IGNORE INTO canon VALUES (?, ?)', (key, entry))
+
+    def find(self, keys):
+        """Запись по первому из ключей, который уже известен (порядок ключей важен, как в dedup_ids)"""
+        for key in keys:
+            row = self.db.execute('SELECT entry FROM ids WHERE key = ?', (key,)).fetchone()
+            if row:
+                return row[0]
+        return None
+
+    def bind(self, keys, entry):
+        self.db.executemany('INSERT OR IGNORE INTO ids VALUES (?, ?)', [(k, entry) for k in keys])
+
+    def close(self):
+        self.db.close()
+
+
+class SortedRuns:
+    """Внешняя сортировка строк по (запись, id): буфер в памяти -> отсортированные файлы -> слияние"""
+
+    def __init__(self, workdir, max_bytes):
+        self.workdir = workdir
+        self.max_bytes = max_bytes
+        self.buffer = []
+        self.buffered = 0
+        self.runs = []
+
+    def add(self, entry, i, line):
+        self.buffer.append((entry, i, line))
+        self.buffered += sys.getsizeof(line) + RECORD_OVERHEAD
+        if self.buffered >= self.max_bytes:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        self.buffer.sort()
+        path = os.path.join(self.workdir, f'run-{len(self.runs):05d}.tsv')
+        with open(path, 'w', encoding='utf-8') as f:
+            for entry, i, line in self.buffer:
+                f.write(f'{entry}\t{i}\t{line}\n')
+        self.runs.append(path)
+        self.buffer = []
+        self.buffered = 0
+
+    @staticmethod
+    def _read(path):
+        with open(path, encoding='utf-8') as f:
+            for row in f:
+                entry, i, line = row.rstrip('\n').split('\t', 2)
+                yield int(entry), int(i), line
+
+    def merged(self):
+        """Все строки в порядке (запись, id); последний буфер сливается без записи на диск"""
+        self.buffer.sort()
+        return heapq.merge(*(self._read(p) for p in self.runs), iter(self.buffer))
+
+
+class CountrySpill:
+    """Каналы одной страны на диске: len() без чтения, итерация - по одному каналу"""
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._file = open(path, 'w', encoding='utf-8')
+
+    def append(self, c):
+        self._file.write(json.dumps([_encode(c), [_encode(a) for a in c['alternates']]],
+                                    ensure_ascii=False, separators=(',', ':')) + '\n')
+        self.count += 1
+
+    def close(self):
+        self._file.close()
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        with open(self.path, encoding='utf-8') as f:
+            for row in f:
+                primary, alternates = json.loads(row)
+                c = _decode(primary)
+                c['alternates'] = [_decode(a) for a in alternates]
+                yield c
+
+
+class SpilledChannels:
+    """Уникальные каналы, сгруппированные по странам на диске; заменяет список каналов в run()"""
+
+    def __init__(self, by_country):
+        self.by_country = by_country
+
+    def __len__(self):
+        return sum(len(c) for c in self.by_country.values())
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self.by_country.values())
+
+
+class OutOfCoreDedup:
+    """Источники сбрасываются на диск по мере загрузки, затем dedup и группировка идут потоком"""
+
+    def __init__(self, max_rss_mb=MAX_RSS_MB, root=SPILL_DIR):
+        self.max_bytes = max_rss_mb * 1024 * 1024
+        self.workdir = tempfile.mkdtemp(prefix='iptv-spill-', dir=root)
+        # Файлы стран читаются до конца запуска (плейлисты, сайт, метаданные) - удаляем при выходе
+        atexit.register(self.cleanup)
+        self.sources = {}
+        self._lock = threading.Lock()
+        self.stats = {'records': 0, 'dropped': 0, 'entries': 0, 'alternates': 0, 'runs': 0, 'peak_rss': 0}
+
+    def _watch_rss(self):
+        rss = current_rss()
+        if rss > self.stats['peak_rss']:
+            self.stats['peak_rss'] = rss
+        return rss
+
+    def spill_source(self, url, channels):
+        """Пишет записи одного источника в свой файл; возвращает число записей"""
+        return self.spill_records(url, ({**c, 'source': url} for c in channels))
+
+    def spill_records(self, key, records):
+        """Пишет записи как есть (источник уже в записи, например из шарда) в файл под ключом key"""
+        with self._lock:
+            path = os.path.join(self.workdir, f'source-{len(self.sources):05d}.jsonl')
+            self.sources[key] = path
+        n = 0
+        with open(path, 'w', encoding='utf-8') as f:
+            for c in records:
+                f.write(_encode(c) + '\n')
+                n += 1
+        self._watch_rss()
+        return n
+
+    def _records(self, urls):
+        """Записи всех источников (ключей spill_records) в порядке urls - тот же порядок id, что у общего ChannelStore"""
+        for url in urls:
+            path = self.sources.get(url)
+            if not path:
+                continue
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    yield line.rstrip('\n')
+
+    def dedup(self, urls, live_only=False):
+        """Возвращает (SpilledChannels, {источник: число основных потоков});
+        live_only - как rank_alternates(..., live_only=True) после обычного пути: только живые потоки"""
+        budget = self.max_bytes
+        # Доли считаются от запаса над уже занятой памятью (интерпретатор, модули, кэши):
+        # освобожденная память процессу обратно почти не возвращается, и потолок должен выдержать весь запуск
+        headroom = max(budget - self._watch_rss(), budget // 4)
+        keys = KeyIndex(os.path.join(self.workdir, 'keys.sqlite'), int(headroom * CACHE_SHARE))
+        runs = SortedRuns(self.workdir, int(headroom * BUFFER_SHARE))
+        unique_by_source = {}
+        entries = 0
+
+        # 1. Проход по записям: тот же алгоритм, что dedup_ids, но ключи в SQLite, а записи - в сортировку
+        for i, line in enumerate(self._records(urls)):
+            c = _decode(line)
+            self.stats['records'] += 1
+            if not keys.add_url(c['url']):
+                self.stats['dropped'] += 1
+                continue
+            ukey = normalize_url(c['url'])
+            entry = keys.url_entry(ukey)
+            if entry is None:
+                ident = ['\x1f'.join(k) for k in identity_keys(c['tvg_id'], c['name'], c['country'])]
+                entry = keys.find(ident)
+                if entry is None:
+                    entry = entries
+                    entries += 1
+                    unique_by_source[c['source']] = unique_by_source.get(c['source'], 0) + 1
+                keys.bind_url(ukey, entry)
+                keys.bind(ident, entry)
+            runs.add(entry, i, line)
+            if runs.buffered and i % 10000 == 0 and self._watch_rss() > budget:
+                # Реальный RSS выше потолка (например, из-за кэша SQLite) - сбрасываем буфер раньше
+                runs.flush()
+        keys.close()
+        self.stats['runs'] = len(runs.runs)
+        self.stats['entries'] = entries
+
+        # 2. Слияние: потоки одной записи идут подряд в порядке id - как ids в entries
+        by_country = {}
+        for _, rows in itertools.groupby(runs.merged(), key=lambda r: r[0]):
+            streams = [_decode(line) for _, _, line in rows]
+            ranked = rank_alternates([_link_alternates(streams[0], streams[1:])])
+            self.stats['alternates'] += len(streams) - 1
+            if live_only:
+                ranked = rank_alternates(ranked, live_only=True)
+                if not ranked:
+                    continue
+            best = ranked[0]
+            spill = by_country.get(best['country'])
+            if spill is None:
+                spill = by_country[best['country']] = CountrySpill(
+                    os.path.join(self.workdir, f'country-{len(by_country):03d}.jsonl'))
+            spill.append(best)
+        for spill in by_country.values():
+            spill.close()
+        self._watch_rss()
+        return SpilledChannels(by_country), unique_by_source
+
+    def summary(self):
+        s = self.stats
+        print(f"💽 Вне памяти: {s['records']} записей, {s['runs']} отсортированных файлов, "
+              f"пик RSS ~{s['peak_rss'] // (1024 * 1024)} МБ (потолок {self.max_bytes // (1024 * 1024)} МБ)")
+
+    def cleanup(self):
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
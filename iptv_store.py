@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""Компактное хранилище каналов: столбцы вместо словарей, повторяющиеся поля - номера в таблицах"""
+import sys
+from array import array
+
+
+class Interner:
+    """Таблица уникальных строк: строка <-> целый номер"""
+
+    def __init__(self):
+        self.values = []
+        self._ids = {}
+
+    def id(self, value):
+        i = self._ids.get(value)
+        if i is None:
+            i = self._ids[value] = len(self.values)
+            self.values.append(value)
+        return i
+
+    def __getitem__(self, i):
+        return self.values[i]
+
+    def __len__(self):
+        return len(self.values)
+
+
+class ChannelStore:
+    """Каналы по целым id; группа, страна, логотип и источник хранятся номерами в таблицах"""
+
+    def __init__(self):
+        self.names = []
+        self.urls = []
+        self.tvg_ids = []
+        self.group_ids = array('I')
+        self.country_ids = array('H')
+        self.logo_ids = array('I')
+        self.source_ids = array('I')
+        self.groups = Interner()
+        self.countries = Interner()
+        self.logos = Interner()
+        self.sources = Interner()
+        # Опции #EXTVLCOPT/#KODIPROP есть у немногих каналов - храним только их
+        self.opts = {}
+
+    def __len__(self):
+        return len(self.urls)
+
+    def add(self, c, source=None):
+        """Добавляет запись-словарь, возвращает id канала"""
+        i = len(self.urls)
+        self.names.append(c['name'])
+        self.urls.append(c['url'])
+        self.tvg_ids.append(c['tvg_id'])
+        self.group_ids.append(self.groups.id(c['group']))
+        self.country_ids.append(self.countries.id(c['country']))
+        self.logo_ids.append(self.logos.id(c['logo']))
+        self.source_ids.append(self.sources.id(source if source is not None else c.get('source', '')))
+        if c.get('opts'):
+            self.opts[i] = tuple(c['opts'])
+        return i
+
+    def extend(self, channels, source=None):
+        for c in channels:
+            self.add(c, source)
+
+    def merge(self, other):
+        """Дописывает другое хранилище (например, один источник) с перекодировкой таблиц"""
+        base = len(self.urls)
+        self.names.extend(other.names)
+        self.urls.extend(other.urls)
+        self.tvg_ids.extend(other.tvg_ids)
+        for mine, table, theirs, their_table in (
+                (self.group_ids, self.groups, other.group_ids, other.groups),
+                (self.country_ids, self.countries, other.country_ids, other.countries),
+                (self.logo_ids, self.logos, other.logo_ids, other.logos),
+                (self.source_ids, self.sources, other.source_ids, other.sources)):
+            remap = [table.id(v) for v in their_table.values]
+            mine.extend(remap[j] for j in theirs)
+        for i, opts in other.opts.items():
+            self.opts[base + i] = opts
+
+    def group(self, i):
+        return self.groups[self.group_ids[i]]
+
+    def country(self, i):
+        return self.countries[self.country_ids[i]]
+
+    def logo(self, i):
+        return self.logos[self.logo_ids[i]]
+
+    def source(self, i):
+        return self.sources[self.source_ids[i]]
+
+    def record(self, i):
+        """Словарь канала (для стадий, которые меняют поля записи)"""
+        return {
+            'name': self.names[i],
+            'group': self.group(i),
+            'logo': self.logo(i),
+            'tvg_id': self.tvg_ids[i],
+            'country': self.country(i),
+            'url': self.urls[i],
+            'opts': self.opts.get(i, ()),
+            'source': self.source(i),
+        }
+
+    def nbytes(self):
+        """Оценка занимаемой памяти: контейнеры плюс каждая уникальная строка один раз"""
+        seen = set()
+        total = 0
+        containers = [self.names, self.urls, self.tvg_ids, self.group_ids, self.country_ids,
+                      self.logo_ids, self.source_ids, self.opts]
+        strings = [self.names, self.urls, self.tvg_ids]
+        for table in (self.groups, self.countries, self.logos, self.sources):
+            containers += [table.values, table._ids]
+            strings.append(table.values)
+        for obj in containers:
+            total += sys.getsizeof(obj)
+        for column in strings:
+            for s in column:
+                if id(s) not in seen:
+                    seen.add(id(s))
+                    total += sys.getsizeof(s)
+        for opts in self.opts.values():
+            total += sys.getsizeof(opts) + sum(sys.getsizeof(o) for o in opts)
+        return total
+
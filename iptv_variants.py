@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""Качество потоков: варианты HLS-манифеста (битрейт, разрешение) и время до первого байта.
+
+Скачиваются только манифесты: у прямых потоков (TS/MP4) читаются первые SNIFF_BYTES, чтобы понять,
+что это не HLS. Разобранные манифесты кэшируются в SQLite и перезапрашиваются не чаще VARIANT_TTL.
+"""
+import json
+import os
+import re
+import sqlite3
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+import requests
+
+from iptv_dedup import iter_streams, rank_alternates
+from iptv_fetch import CircuitOpenError, http_get, fetch_many
+from iptv_history import url_key
+from iptv_m3u import parse_master
+from iptv_probe import ProbeError, PROBE_LIMITER, PROBE_TIMEOUT, MANIFEST_LIMIT, HEADERS
+
+VARIANT_DB = os.environ.get('IPTV_VARIANT_DB', '.cache/variants.sqlite')
+# Сколько манифестов запрашивать за запуск (0 - без ограничения); остальные ждут следующего запуска
+VARIANT_BUDGET = int(os.environ.get('IPTV_VARIANT_BUDGET', '3000'))
+VARIANT_WORKERS = int(os.environ.get('IPTV_VARIANT_WORKERS', '64'))
+# Общий бюджет времени на стадию, секунд
+VARIANT_DEADLINE = float(os.environ.get('IPTV_VARIANT_DEADLINE', '120'))
+# Список вариантов меняется редко; неудачный запрос повторяем раньше
+VARIANT_TTL = 24 * 3600
+VARIANT_RETRY = 3600
+# Цена задержки в строках разрешения: 1080p с TTFB 1 с уступает 720p с TTFB 100 мс
+TTFB_WEIGHT = 0.5
+SNIFF_BYTES = 512
+# Прямые медиафайлы: манифеста у них нет, а качать медиа стадия не должна
+MEDIA_EXTENSIONS = ('.ts', '.mp4', '.mkv', '.flv', '.avi', '.mp3', '.aac', '.webm', '.mov')
+
+# Пометка качества в названии: "Abai TV (720p)" - запасная оценка, если манифест не сказал
+NAME_HEIGHT_RE = re.compile(r'\b(\d{3,4})[pi]\b', re.IGNORECASE)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS variants (
+    key TEXT PRIMARY KEY,
+    ts REAL NOT NULL,
+    ttfb INTEGER,
+    variants TEXT,
+    error TEXT
+);
+'''
+
+
+def inspect_master(url, deadline):
+    """{'ttfb': мс, 'variants': [...] или None для не-HLS}; бросает ProbeError при неудаче"""
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise ProbeError('deadline')
+    try:
+        r = http_get(url, timeout=min(PROBE_TIMEOUT, remaining), headers=HEADERS, stream=True,
+                     limiter=PROBE_LIMITER, retries=0)
+    except CircuitOpenError:
+        raise ProbeError('host_down')
+    except requests.exceptions.Timeout:
+        raise ProbeError('timeout')
+    except requests.exceptions.SSLError:
+        raise ProbeError('ssl')
+    except requests.exceptions.ConnectionError:
+        raise ProbeError('connection')
+    # Ожидание в очереди лимитера хоста - не задержка сервера: считаем от отправки запроса
+    headers_at = time.monotonic()
+    with r:
+        if r.status_code >= 400:
+            raise ProbeError('http_5xx' if r.status_code >= 500 else 'http_4xx', str(r.status_code))
+        try:
+            chunks = r.iter_content(SNIFF_BYTES)
+            body = bytearray(next(chunks, b''))
+            ttfb = int((r.elapsed.total_seconds() + time.monotonic() - headers_at) * 1000)
+            if not body.lstrip(b'\xef\xbb\xbf \r\n').startswith(b'#EXTM3U'):
+                # Прямой поток: дальше не читаем
+                return {'ttfb': ttfb, 'variants': None}
+            for chunk in chunks:
+                body += chunk
+                if len(body) >= MANIFEST_LIMIT:
+                    break
+        except requests.exceptions.RequestException:
+            raise ProbeError('timeout')
+    return {'ttfb': ttfb, 'variants': parse_master(bytes(body[:MANIFEST_LIMIT]).decode('utf-8', 'replace'))}
+
+
+def summarize(c, result):
+    """c['variant']: лучший вариант, TTFB и оценка для сортировки альтернатив"""
+    if 'error' in result:
+        return {'error': result['error']}
+    variants = result['variants'] or []
+    best = variants[0] if variants else (0, 0, 0)
+    bandwidth, width, height = best
+    if width and height:
+        resolution = f'{width}x{height}'
+    else:
+        resolution = None
+        m = NAME_HEIGHT_RE.search(c['name'])
+        height = int(m.group(1)) if m else 0
+    info = {'ttfb': result['ttfb'], 'hls': result['variants'] is not None, 'variants': len(variants),
+            'height': height, 'score': round(height - TTFB_WEIGHT * result['ttfb'], 1)}
+    if resolution:
+        info['resolution'] = resolution
+    if bandwidth:
+        info['bandwidth'] = bandwidth
+    return info
+
+
+class VariantCache:
+    """Результаты разбора манифестов по URL между запусками"""
+
+    def __init__(self, path=VARIANT_DB):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def lookup(self, url, now):
+        row = self.db.execute('SELECT ts, ttfb, variants, error FROM variants WHERE key = ?',
+                              (url_key(url),)).fetchone()
+        if not row:
+            return None
+        ts, ttfb, variants, error = row
+        if now - ts > (VARIANT_RETRY if error else VARIANT_TTL):
+            return None
+        if error:
+            return {'error': error}
+        return {'ttfb': ttfb, 'variants': json.loads(variants)}
+
+    def put(self, url, result, now):
+        self.db.execute('INSERT OR REPLACE INTO variants (key, ts, ttfb, variants, error) VALUES (?, ?, ?, ?, ?)',
+                        (url_key(url), now, result.get('ttfb'), json.dumps(result.get('variants')),
+                         result.get('error')))
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+def _inspect(url, deadline):
+    try:
+        return inspect_master(url, deadline)
+    except ProbeError as e:
+        return {'error': e.kind}
+    except Exception:
+        return {'error': 'error'}
+
+
+def inspect_variants(channels, budget=VARIANT_BUDGET, deadline_s=VARIANT_DEADLINE, workers=VARIANT_WORKERS):
+    """Заполняет c['variant'] у всех потоков (из кэша или запросом) и пересортировывает альтернативы"""
+    now = time.time()
+    deadline = time.monotonic() + deadline_s
+    cache = VariantCache()
+    todo = []
+    stats = Counter()
+    for entry in channels:
+        # Сначала потоки каналов с альтернативами: для них порядок важнее всего
+        priority = 0 if entry.get('alternates') else 1
+        for c in iter_streams([entry]):
+            # Стадия --probe в этом запуске уже скачала манифест - второй раз не запрашиваем
+            probed = (c.get('probe') or {}).pop('manifest', None)
+            if probed is not None:
+                cache.put(c['url'], probed, now)
+                c['variant'] = summarize(c, probed)
+                stats['probed'] += 1
+                continue
+            if urlsplit(c['url']).path.lower().endswith(MEDIA_EXTENSIONS):
+                stats['media'] += 1
+                continue
+            cached = cache.lookup(c['url'], now)
+            if cached is not None:
+                c['variant'] = summarize(c, cached)
+                stats['cached'] += 1
+            else:
+                todo.append((priority, c))
+    todo = [c for _, c in sorted(todo, key=lambda t: t[0])]
+    if budget and len(todo) > budget:
+        stats['deferred'] = len(todo) - budget
+        todo = todo[:budget]
+
+    results = fetch_many([c['url'] for c in todo], lambda u: _inspect(u, deadline), max_workers=workers)
+    for c, result in zip(todo, results):
+        result = result or {'error': 'error'}
+        if result.get('error') == 'deadline':
+            # Не успели - поток не хуже непроверенного, спросим в следующий раз
+            stats['deadline'] += 1
+            continue
+        cache.put(c['url'], result, now)
+        c['variant'] = summarize(c, result)
+        stats[result.get('error') or ('hls' if result['variants'] is not None else 'direct')] += 1
+    cache.close()
+
+    print(f"📐 Варианты HLS: запрошено {len(todo)} ({', '.join(f'{k}: {v}' for k, v in stats.most_common())})")
+    return rank_alternates(channels)